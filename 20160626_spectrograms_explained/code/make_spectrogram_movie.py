@@ -9,31 +9,22 @@ https://github.com/weegreenblobbie/sd_audio_hackers
 
 # python
 import argparse
-import glob
-import os
+import hashlib
+import json
 import os.path
+import shutil
 import sys
-
-assert sys.version_info.major == 2, "python 2 only!"
+import tempfile
 
 
 # third party
 
-import matplotlib
-import matplotlib.pyplot as plt
-import numpy as np
-#~from scipy.io.wavfile import read as _wavread  # broken!
-
-# Using Nsound to read wavefile since scipy 0.13.3 is broken for stereo, int32 files
-
-import Nsound as ns
-
-#-----------------------------------------------------------------------------
-# Globals
-
-# Assumes linx system with ffmpeg installed
-
-png_filename = '/tmp/movie_%06d.png'
+from sdaudio import assert_py3
+from sdaudio import movie as sdmovie
+from sdaudio import wavio
+from sdaudio import stft
+from sdaudio import stft_cache
+from sdaudio import video
 
 
 def main():
@@ -56,6 +47,17 @@ def main():
         help = 'the freq max (ymax) of the spectrogram'
     )
 
+    parser.add_argument(
+        '-b',
+        '--bins',
+        type = int,
+        default = None,
+        help = (
+            'the number of frequency bins computed between 0 and fmax with a '
+            'chirp-z zoom, by default the full band is computed at the stft\'s '
+            'frequency step'),
+    )
+
     parser.add_argument(
         '-w',
         '--width',
@@ -72,6 +74,49 @@ def main():
         help = 'the rate of frames per second'
     )
 
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type = int,
+        default = 1,
+        help = 'the number of processes rendering frames',
+    )
+
+    parser.add_argument(
+        '-o',
+        '--output',
+        default = 'movie.mp4',
+        help = 'the output movie, encoded with ffmpeg',
+    )
+
+    parser.add_argument(
+        '--resume',
+        action = 'store_true',
+        help = (
+            'encode in segments kept in the work directory, re-running after an '
+            'interruption skips the finished segments'),
+    )
+
+    parser.add_argument(
+        '--segment',
+        type = float,
+        default = 10.0,
+        help = 'the length in seconds of the segments encoded with --resume',
+    )
+
+    parser.add_argument(
+        '--work-dir',
+        default = os.path.join(tempfile.gettempdir(), 'spectro_movie'),
+        help = 'where --resume keeps its segments, default %(default)s',
+    )
+
+    parser.add_argument(
+        '--no-cache',
+        action = 'store_true',
+        help = 'always compute the spectrogram, by default it is cached in %s' % (
+            stft_cache.default_directory()),
+    )
+
     parser.add_argument(
         'input_wav',
         help = 'The input wavfile to process',
@@ -85,565 +130,177 @@ def main():
     assert args.fps > 0, "args.fps <= 0"
     assert args.width > 0, "args.width <= 0"
     assert args.fmax > 0, "args.fmax <= 0"
-
-    matplotlib.rc('figure', figsize = [16, 6])
-    matplotlib.rcParams.update({'figure.subplot.left'  : 0.09 })
-    matplotlib.rcParams.update({'figure.subplot.bottom': 0.15 })
-    matplotlib.rcParams.update({'figure.subplot.right' : 0.97 })
-    matplotlib.rcParams.update({'figure.subplot.top'   : 0.88 })
-
-    #-------------------------------------------------------------------------
-    # remove existing .png files
-
-    pattern = png_filename.replace('%06d', '*')
-
-    files = glob.glob(pattern)
-
-    for f in files:
-        os.remove(f)
-
-    #-------------------------------------------------------------------------
-    # read wavfile in
-
-    sr, x = wavread(args.input_wav)
-
-    if x.ndim > 1:
-
-        if args.channel is not None:
-            x = x[:, args.channel]
-
-        else:
-            raise RuntimeError(
-                'Input wav has %d channles, use --channels to select one' % x.ndim
-            )
-
-    duration = x.size / float(sr)
+    assert args.bins is None or args.bins > 1, "args.bins <= 1"
+    assert args.jobs > 0, "args.jobs <= 0"
+    assert args.segment > 0, "args.segment <= 0"
 
     print("Hello spectro movie!")
 
     #-----------------------------------------------------------------------------
-    # compute spectrogram
-
-    cfg = Stft.get_defaults()
-
-    cfg['sample_rate'] = sr
+    # compute spectrogram, streaming the wavfile in blocks, or reuse the
+    # cached result of an earlier run
 
-    stft_op = Stft(**cfg)
-
-    data = stft_op(sample_rate = sr, signal = x)
-
-    #-------------------------------------------------------------------------
-    # plot data
+    fmt = wavio.read_chunks(args.input_wav)['fmt ']
 
-    time_axis = data['stft_time_axis']
-    freq_axis = data['stft_freq_axis']
+    n_channels = fmt['channels']
 
-    amp = np.abs(data['stft_spec']) ** 0.33
-
-    plt.figure()
-    imagesc(time_axis, freq_axis, amp.T, cmap = 'bone')
-    plt.xlabel('Time (s)')
-    plt.ylabel('Frequency (Hz)')
-
-    plt.ylim([freq_axis[0], args.fmax])
-
-    ax = plt.gca()
-
-    ax.set_axis_bgcolor('black')
-
-    #-------------------------------------------------------------------------
-    # main rendering loop
-
-    h_width = 0.5 * args.width
-
-    t = 0.0
-    x0 = t - h_width
-    x1 = t + h_width
-
-    xlim = np.array([x0, x1])
-
-    t_step = 1.0 / args.fps
-
-    # draw verticle line
-
-    t_line = plt.axvline(x = t, color = 'r')
-
-    idx = 0
-
-    update_frame = int(0.5 * args.fps)
-
-    while t < duration:
-
-        t_line.set_xdata(t)
-        ax.set_xlim(xlim)
-
-        fout = png_filename % idx
+    if n_channels > 1 and args.channel is None:
+        raise RuntimeError(
+            'Input wav has %d channels, use --channel to select one' % n_channels
+        )
 
-        plt.title('Time = %.2f seconds' % t)
+    fmax = min(args.fmax, 0.5 * fmt['sample_rate'])
 
-        plt.savefig(fout)
+    # with --bins only the displayed band is computed, with a chirp-z zoom
+    # when the bins are finer than the full band rfft's
 
-        t += t_step
-        xlim += t_step
-        idx += 1
+    zoom = dict()
 
-        if idx % update_frame == 0:
-            pdone = 100.0 * t / duration
-            sys.stdout.write('                \rRendering: %6.2f%%' % pdone)
-            sys.stdout.flush()
+    if args.bins is not None:
+        zoom = dict(fmin = 0.0, fmax = fmax, zoom_bins = args.bins)
 
-    pdone = 100.0
-    sys.stdout.write('                \rRendering: %6.2f%%' % pdone)
-    print("")
+    stft_wav = stft_cache.stft_wav
 
+    if args.no_cache:
+        stft_wav = stft.stft_wav
 
-    #--------------------------------------------------------------------------
-    # encode audio + video
-
-    #~    # Pass 1
-    #~    cmd = (
-    #~        'ffmpeg -r {fps} -i {pngfiles} -r {sr} -i "{audiofile}" -pass 1 -vcodec libtheora '
-    #~        '-b:v 6000k -bt 6000k -pix_fmt yuv444p -r {fps} -f rawvideo -y /dev/null')
-
-    #~    cmd = cmd.format(
-    #~        audiofile = args.input_wav,
-    #~        fps = args.fps,
-    #~        pngfiles = png_filename,
-    #~        sr = sr,
-    #~    )
-
-    #~    os.system(cmd)
-
-    #~    # Pass 2
-
-    #~    cmd = (
-    #~        'ffmpeg -r {fps} -i {pngfiles} -r {sr} -i "{audiofile}" -pass 2 -vcodec libtheora '
-    #~        '-b:v 6000k -bt 6000k -pix_fmt yuv444p -r {fps} movie.ogv -y'
-    #~    )
-
-    #~    cmd = cmd.format(
-    #~        audiofile = args.input_wav,
-    #~        fps = args.fps,
-    #~        pngfiles = png_filename,
-    #~        sr = sr,
-    #~    )
-
-    #~    os.system(cmd)
-
-
-    cmd = (
-        'ffmpeg '
-        '-r {fps} '
-        '-f image2 '
-        '-s 1280x720 '
-        '-i "{png_filename}" '
-        '-i "{audiofile}" '
-        '-vcodec libx264 '
-        '-b:v 4M '
-        '-strict -2 '
-        '-y '
-        'movie.mp4'
+    data = stft_wav(
+        args.input_wav,
+        channel = args.channel,
+        output = 'compressed',
+        output_exponent = 0.33,
+        **zoom
     )
 
-    cmd = cmd.format(fps = args.fps, png_filename = png_filename, sr = sr, audiofile = args.input_wav)
-
-    print("-" * 80)
-    print("Encoding images with command:")
-    print("    cmd: %s" % repr(cmd))
-    print("-" * 80)
-
-    os.system(cmd)
-
-    print("Wrote: movie.mp4")
-    print("Goodbye!")
-
+    sr = data['sample_rate']
 
-"""
-Short time Fourier transform
-"""
+    duration = data['n_samples'] / float(sr)
 
-class Stft:
-
-    @staticmethod
-    def get_defaults():
-
-        return dict(
-            sample_rate = 8000.0,
-            t_sigma = 0.01,
-            t_step = 0.01,
-            f_step = 16.666,
-            window = 'gaussian',
+    #-------------------------------------------------------------------------
+    # rasterize the spectrogram once, every movie frame is a crop of it.  With
+    # more than one job the raster is memory mapped from a temporary file,
+    # which the worker processes share.
+
+    with tempfile.TemporaryDirectory(prefix = 'spectro_movie_') as tmp_dir:
+
+        raster_path = None
+
+        if args.jobs > 1:
+            raster_path = os.path.join(tmp_dir, 'raster.npy')
+
+        movie = sdmovie.SpectrogramMovie(
+            data['stft_spec'],
+            data['stft_time_axis'],
+            data['stft_freq_axis'],
+            duration,
+            width = args.width,
+            fps = args.fps,
+            fmax = fmax,
+            cmap = 'bone',
+            raster_path = raster_path,
         )
 
+        def frames(i0, i1):
 
-    def __init__(self, **kwargs):
-        """
-        Computes the short time fourier transform on input signal.
-
-        keyword arguments:
-
-            sample_rate : float
-                The sample rate of the input signal.
-
-            t_sigma : float
-                The standard deviation of the gaussian time-envelope used for
-                the window.
-
-            t_step : float
-                The time step in seconds between fft samples
-
-            f_step : float
-                The frequency axis step size (nfft & frame_size are derived from this)
-
-            window : str
-                The name of the window to apply to the frame, one of: [
-                    'gaussian', 'rectangular']
-        """
+            if args.jobs > 1:
+                return sdmovie.render_parallel(movie, args.jobs, i0, i1)
 
-        sr = kwargs['sample_rate']
-        t_sigma = kwargs['t_sigma']
-        t_step  = kwargs['t_step']
-        f_step  = kwargs['f_step']
-        window  = kwargs['window']
-
-        assert sr > 0, "sample_rate <= 0"
-        assert t_sigma > 0, "t_sigma <= 0"
-        assert t_step > 0, "t_step <= 0"
-        assert f_step > 0, "f_step <= 0"
-
-        step = int(np.round(sr * t_step))
-
-        #---------------------------------------------------------------------
-        # compute frame size, nearest power of 2
-
-        size_f_step = int(sr / f_step)
-        size_t_sigma = int(np.round(sr * 6.0 * t_sigma))
-
-        frame_size = round_up2(min(size_f_step, size_t_sigma))
-        nfft = frame_size
+            return movie.frames(i0, i1)
 
         #---------------------------------------------------------------------
-        # setup freq axis
-
-        nyquist = sr / 2.0
-
-        freq_axis = np.linspace(0, nyquist, nfft / 2 + 1).astype(np.float32)
-
-        #---------------------------------------------------------------------
-        # window
-
-        if window == 'gaussian':
-
-            t = np.arange(nfft) / float(sr)
-            mu = np.mean(t)
+        # main rendering loop, the frames are piped into ffmpeg and encoded
+        # with the audio
 
-            w = np.exp(-0.5 * ((t - mu) / t_sigma) ** 2.0)
+        if args.resume:
 
-        elif window == 'rectangular':
-            w = np.ones(nfft)
+            render_resumable(args, movie, frames)
 
         else:
-            raise ValueError('unknown window type "%s"' % window)
 
-        w = w.astype(np.float32)
-        w /= np.sum(w)
-
-        #---------------------------------------------------------------------
-        # save values into object
-
-        self._freq_axis = freq_axis
-        self._nfft = nfft
-        self._sample_rate = sr
-        self._step = step
-        self._window = w
-
-
-    def __call__(self, **kwargs):
-        """
-        inputs: signal, sample_rate
-        outputs: stft_spec, stft_freq_axis, stft_time_axis
-        """
-
-        signal = kwargs['signal']
-        sample_rate = kwargs['sample_rate']
-
-        assert int(self._sample_rate) == int(sample_rate), "sample_rate != %d" % self._sample_rate
-        assert signal.ndim == 1, "signal must be 1D"
-
-        # compute slices of the input signal
-
-        sample_slices = compute_sample_slices(
-            len(signal),
-            self._nfft,
-            self._step
-        )
-
-        #---------------------------------------------------------------------
-        # forward stft
-
-        n_time = len(sample_slices)
-
-        time_axis = np.zeros(n_time)
-
-        spec = np.zeros((n_time, len(self._freq_axis)), np.complex64)
-
-        for i in xrange(n_time):
-
-            center, s0, s1, pad_l, pad_r = sample_slices[i]
-
-            time_axis[i] = center
-
-            s = np.array(signal[s0 : s1])
-
-            if pad_l > 0:
-                s = np.hstack([np.zeros((pad_l), np.float32), s])
-
-            if pad_r > 0:
-                s = np.hstack([s, np.zeros((pad_r), np.float32)])
-
-            s = s * self._window
-
-            spec[i,:] = np.fft.rfft(s)
-
-        #---------------------------------------------------------------------
-        # conver time axis into seconds
-
-        time_axis = time_axis.astype(np.float32) / self._sample_rate
-
-        out = dict(
-            stft_spec = spec,
-            stft_freq_axis = np.array(self._freq_axis),
-            stft_time_axis = time_axis,
-        )
-
-        kwargs.update(out)
-
-        return kwargs
-
-
-def round_up2(n):
-    """
-    Rounds up to next power of 2.  Returns n if n is already a power of 2.
-    """
-
-    assert n > 0, "n <= 0"
-
-    return int(2 ** np.ceil(np.log(n) / np.log(2)))
-
-
-def compute_sample_slices(N, frame_size, step):
-    """
-    Computes tart and stop indices and padding.
-
-    Returns a list of tuples:
-
-        (center_idx, begin_idx, end_idx, pad_left, pad_right),
-
-    """
-
-    assert N > 0, 'N <= 0'
-    assert frame_size > 0, 'frame_size <= 0'
-    assert step > 0, 'step <= 0'
-
-    #-------------------------------------------------------------------------
-    # compute center indicies for each frame
-
-    h_frame = frame_size // 2
-
-    centers = []
-
-    c_idx = 0
-
-    while c_idx < N + h_frame:
-        centers.append(c_idx)
-        c_idx += step
-
-    #-------------------------------------------------------------------------
-    # sampl
+            writer = video.VideoWriter(
+                args.output,
+                movie.size,
+                args.fps,
+                audio_filename = args.input_wav,
+            )
 
-    sample_slices = []
+            print("-" * 80)
+            print("Encoding with command:")
+            print("    cmd: %s" % repr(' '.join(writer.command)))
+            print("-" * 80)
 
-    for c_idx in centers:
+            update_frame = int(0.5 * args.fps)
 
-        i0 = c_idx - h_frame
-        i1 = c_idx + h_frame
+            with writer:
 
-        pad_l = 0
-        pad_r = 0
+                for idx, frame in frames(0, movie.n_frames):
 
-        if i0 < 0:
-            pad_l = abs(i0)
-            i0 = 0
+                    writer.write(frame)
 
-        if i1 >= N:
-            pad_r = i1 - N + 1
-            i1 = N - 1
+                    if idx % update_frame == 0:
+                        pdone = 100.0 * idx / movie.n_frames
+                        sys.stdout.write('                \rRendering: %6.2f%%' % pdone)
+                        sys.stdout.flush()
 
-        sample_slices.append( (c_idx, i0, i1, pad_l, pad_r) )
+            pdone = 100.0
+            sys.stdout.write('                \rRendering: %6.2f%%' % pdone)
+            print("")
 
-    return sample_slices
+    print("Wrote: %s" % args.output)
+    print("Goodbye!")
 
 
-def imagesc(x_axis, y_axis, Z, axes = None, **kwargs):
+def render_resumable(args, movie, frames):
     """
-    Plots the 2D matriz Z using the provided x & y axis for data labels.
-    Additional keyword argumnts will be passed on to the Matplotlib imshow()
-    method.
-
-    Parameters:
-        *x_axis*
-            The data labels to use for the x axis, must be linear (shape N)
-
-        *y_axis*
-            The data labels to use for the y axis, must be linear (shape M)
-
-        *Z*
-            The data matrix to plot (shape M,N)
-
-        *axes*
-            The matplotlib.axes.Axes to draw on
-
-        `**kwargs`
-            Keyword arguments passed to matplotlib.axes.Axes.imshow()
-
-    Returns:
-
-        *h*
-            The graphical handle
-
-    Examples:
-
-        By default, the origin is in the lower left corner:
-
-        .. plot::
-            :include-source:
-
-            import numpy as np
-            import matplotlib.pyplot as plt
-
-            from prospero.plot.imagesc import imagesc
-
-            # Create a data matrix, the Idenity with some zeros concatenated
-            data = np.eye(5)
-            data = np.hstack( (data, np.zeros((5,1))) )
-
-            x_axis = range(6)
-            y_axis = range(5)
-
-            plt.figure()
-            imagesc(x_axis, y_axis, data)
-            plt.xlabel("X axis")
-            plt.ylabel("Y axis")
-
-        To change it, pass the matplotlib.axes.Axes.imshow() keyword argument
-        `origin="upper"`:
-
-        .. plot::
-            :include-source:
-
-            import numpy as np
-            import matplotlib.pyplot as plt
-
-            from prospero.plot.imagesc import imagesc
-
-            # Create a data matrix, the Idenity with some zeros concatenated
-            data = np.eye(5)
-            data = np.hstack( (data, np.zeros((5,1))) )
-
-            x_axis = range(6)
-            y_axis = range(5)
-
-            plt.figure()
-            imagesc(x_axis, y_axis, data, origin = "upper")
-            plt.xlabel("X axis")
-            plt.ylabel("Y axis")
-
+    Encodes the movie in segments in a work directory keyed by the input
+    file and the render settings, skipping the segments an earlier,
+    interrupted run finished, then joins them with the audio.
     """
 
-    # always make a copy so that caller doesn't get a linked colormap by
-    # accident!
-
-    Z = np.array(Z)
-
-    if Z.ndim != 2:
-        raise ValueError("Z should be 2D, not %dD" % Z.ndim)
-
-    M, N = Z.shape
-
-    if x_axis is None:
-        x_axis = np.arange(N).astype(np.int32)
-
-    if y_axis is None:
-        y_axis = np.arange(M).astype(np.int32)
-
-    # Convert to arrays if lists.
-    x_axis = np.array(x_axis)
-    y_axis = np.array(y_axis)
-
-    if M != y_axis.size:
-        raise ValueError("y_axis.size != Z rows (%d != %d)" %(y_axis.size, M))
-
-    if N != x_axis.size:
-        raise ValueError("x_axis.size != Z cols (%d != %d)" %(x_axis.size, N))
-
-    # Override these if not set.
-
-    kwargs.setdefault('origin', 'lower')
-    kwargs.setdefault('interpolation', 'nearest')
-
-    y_axis = y_axis[::-1]
-
-    if kwargs['origin'] == 'lower':
-        y_axis = y_axis[::-1]
-
-    dx = x_axis[1] - x_axis[0]
-    dy = y_axis[1] - y_axis[0]
-
-    extent = \
-    [
-        x_axis[0]  - 0.5 * dx,
-        x_axis[-1] + 0.5 * dx,
-        y_axis[0]  - 0.5 * dy,
-        y_axis[-1] + 0.5 * dy
-    ]
-
-    # Always override these keyword.
-    kwargs["extent"] = extent
-
-    ax = axes
-
-    if ax is None:
-        h = plt.imshow(Z, **kwargs)
-        ax = plt.gca()
-
-    else:
-        h = ax.imshow(Z, **kwargs)
+    params = dict(
+        version = 1,
+        input_hash = stft_cache.file_hash(args.input_wav),
+        channel = args.channel,
+        fmax = args.fmax,
+        bins = args.bins,
+        width = args.width,
+        fps = args.fps,
+        size = list(movie.size),
+        segment = args.segment,
+    )
 
-    ax.axis("tight")
+    key = hashlib.sha1(json.dumps(params, sort_keys = True).encode('utf-8')).hexdigest()
 
-    return h
+    work_dir = os.path.join(args.work_dir, key)
 
+    segment_frames = max(1, int(round(args.segment * args.fps)))
 
-def wavread(filename):
+    encoder = video.SegmentedEncoder(work_dir, movie.n_frames, movie.size, args.fps, segment_frames)
 
-    import Nsound as ns
+    with open(os.path.join(work_dir, 'params.json'), 'w') as fd:
+        json.dump(params, fd, indent = 1, sort_keys = True)
 
-    a = ns.AudioStream(filename)
+    segments = encoder.segments
+    pending = encoder.pending()
 
-    sr = a.getSampleRate()
+    print("-" * 80)
+    print("Work directory: %s" % work_dir)
+    print("Segments done: %d of %d" % (len(segments) - len(pending), len(segments)))
+    print("-" * 80)
 
-    n_channels = a.getNChannels()
-    n_samples = a.getLength()
+    for n, (k, i0, i1) in enumerate(pending):
 
-    x = np.zeros((n_samples, n_channels), np.float32)
+        encoder.encode(k, (frame for idx, frame in frames(i0, i1)))
 
-    for c in range(n_channels):
-        x[:,c] = a[c].toList()
+        pdone = 100.0 * (len(segments) - len(pending) + n + 1) / len(segments)
+        sys.stdout.write('                \rRendering: %6.2f%%' % pdone)
+        sys.stdout.flush()
 
-    x = np.squeeze(x) # remove singular dimensions if present
+    print("")
 
-    return sr, x
+    encoder.finish(args.output, args.input_wav)
 
+    shutil.rmtree(work_dir)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+"""
+Compares the 'pow2' and 'smooth' Stft fft_size_policy: frame sizes, estimated
+FLOPs per frame and measured run time.
+"""
+
+import time
+
+import numpy as np
+
+
+from sdaudio.stft import Stft
+
+
+def rfft_flops(n):
+    """
+    Rough operation count of a real fft of size n, 2.5 * n * log2(n).
+    """
+    return 2.5 * n * np.log2(n)
+
+
+def main():
+
+    duration = 60.0
+
+    window_sizes = [0.020, 0.050, 0.100]
+
+    sample_rates = [16000, 44100, 48000, 96000]
+
+    print('%8s %8s %8s %8s %8s %10s %10s %9s %9s' % (
+        'sr', 'window', 'size', 'pow2', 'smooth', 'pow2 s', 'smooth s', 'flops', 'time'))
+
+    for sr in sample_rates:
+
+        x = np.random.randn(int(duration * sr)).astype(np.float32)
+
+        for window_size in window_sizes:
+
+            cfg = Stft.get_defaults()
+
+            cfg['sample_rate'] = sr
+            cfg['t_sigma'] = window_size / 6.0
+            cfg['f_step'] = 1.0 / window_size
+
+            size = int(np.round(sr * window_size))
+
+            nfft = dict()
+            secs = dict()
+
+            for policy in ['pow2', 'smooth']:
+
+                cfg['fft_size_policy'] = policy
+
+                stft_op = Stft(**cfg)
+
+                nfft[policy] = stft_op._nfft
+
+                t0 = time.time()
+                stft_op(signal = x, sample_rate = sr)
+                secs[policy] = time.time() - t0
+
+            saved = 1.0 - rfft_flops(nfft['smooth']) / rfft_flops(nfft['pow2'])
+
+            speedup = 1.0 - secs['smooth'] / secs['pow2']
+
+            print('%8d %8.3f %8d %8d %8d %10.3f %10.3f %8.1f%% %8.1f%%' % (
+                sr,
+                window_size,
+                size,
+                nfft['pow2'],
+                nfft['smooth'],
+                secs['pow2'],
+                secs['smooth'],
+                100.0 * saved,
+                100.0 * speedup,
+            ))
+
+
+if __name__ == "__main__":
+    main()
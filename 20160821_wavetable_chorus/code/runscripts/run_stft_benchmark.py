@@ -0,0 +1,104 @@
+"""
+Benchmarks the Stft and checks its output against the per-frame reference
+implementation, see sdaudio.benchmark.
+
+Exits with status 1 if any output is out of tolerance or, with --baseline, if
+any case got slower than --max-slowdown times the baseline.
+"""
+
+import argparse
+import sys
+
+
+from sdaudio import benchmark
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '-q',
+        '--quick',
+        action = 'store_true',
+        help = 'run a small subset of the cases',
+    )
+
+    parser.add_argument(
+        '-r',
+        '--repeat',
+        type = int,
+        default = 3,
+        help = 'the number of timed runs per case, the best is reported',
+    )
+
+    parser.add_argument(
+        '-s',
+        '--save',
+        default = None,
+        help = 'write the results to this json file',
+    )
+
+    parser.add_argument(
+        '-b',
+        '--baseline',
+        default = None,
+        help = 'a json file from --save to compare the run times with',
+    )
+
+    parser.add_argument(
+        '--max-slowdown',
+        type = float,
+        default = 1.25,
+        help = 'the allowed run time ratio to the baseline',
+    )
+
+    args = parser.parse_args()
+
+    assert args.repeat > 0, "args.repeat <= 0"
+
+    print('%-68s %10s %12s %10s %10s %9s %4s' % (
+        'case', 'seconds', 'frames/s', 'alloc MB', 'rss MB', 'error', 'ok'))
+
+    def report(r):
+        print('%-68s %10.4f %12.0f %10.1f %10.1f %9.1e %4s' % (
+            r['name'],
+            r['seconds'],
+            r['frames_per_s'],
+            r['alloc_bytes'] / 2.0 ** 20,
+            r['peak_rss'] / 2.0 ** 20,
+            r['max_err'],
+            'ok' if r['ok'] else 'FAIL',
+        ))
+        sys.stdout.flush()
+
+    results = benchmark.run(args.quick, args.repeat, report)
+
+    failed = [r['name'] for r in results if not r['ok']]
+
+    if args.save:
+        benchmark.save_results(args.save, results)
+        print("Wrote: %s" % args.save)
+
+    slow = []
+
+    if args.baseline:
+
+        slow = benchmark.compare_results(
+            results,
+            benchmark.load_results(args.baseline),
+            args.max_slowdown,
+        )
+
+        for name, t0, t1 in slow:
+            print('SLOWER: %s %.4f s -> %.4f s' % (name, t0, t1))
+
+    for name in failed:
+        print('OUT OF TOLERANCE: %s' % name)
+
+    if failed or slow:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
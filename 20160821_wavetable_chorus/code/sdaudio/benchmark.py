@@ -0,0 +1,369 @@
+"""
+Stft benchmark and accuracy suite
+
+Times Stft and compute_sample_slices() over a grid of signal lengths, sample
+rates, time/frequency resolutions and windows, and checks every output
+against a straightforward per-frame reference implementation that is kept
+here unoptimized on purpose.
+
+Each case reports:
+
+    seconds : the best of `repeat` runs
+    frames_per_s : frames computed per second
+    alloc_bytes : the peak bytes allocated by the call, from tracemalloc
+    peak_rss : the process peak resident set size after the call
+    max_err : the max abs error relative to the reference's max abs value
+    ok : max_err <= the tolerance of the case's precision
+
+Results can be saved and compared with a later run to catch slowdowns, see
+save_results() and compare_results(), or runscripts/run_stft_benchmark.py.
+"""
+
+import itertools
+import json
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+
+from sdaudio import assert_py3
+from sdaudio import stft
+
+
+# max relative error allowed per precision
+
+TOLERANCE = dict(
+    single = 1e-5,
+    double = 1e-12,
+)
+
+
+#-----------------------------------------------------------------------------
+# reference implementations
+
+
+def reference_stft(stft_op, signal):
+    """
+    Computes the complex stft of a 1D signal one frame at a time, in double
+    precision, with the frame size, step and window of stft_op.
+    """
+
+    nfft = stft_op._nfft
+    window = np.asarray(stft_op._window, np.float64)
+
+    slices = reference_sample_slices(len(signal), nfft, stft_op._step)
+
+    spec = np.zeros((len(slices), nfft // 2 + 1), np.complex128)
+
+    for i, (center, s0, s1, pad_l, pad_r) in enumerate(slices):
+
+        s = np.array(signal[s0 : s1], np.float64)
+
+        s = np.hstack([np.zeros(pad_l), s, np.zeros(pad_r)])
+
+        spec[i, :] = np.fft.rfft(s * window)
+
+    time_axis = np.array([s[0] for s in slices], np.float32) / stft_op._sample_rate
+
+    return spec, time_axis
+
+
+def reference_sample_slices(N, frame_size, step):
+    """
+    Returns the list of (center, begin, end, pad_left, pad_right) tuples
+    compute_sample_slices() is expected to produce.
+    """
+
+    h_frame = frame_size // 2
+
+    slices = []
+
+    for center in range(0, N + h_frame, step):
+
+        s0 = center - h_frame
+        s1 = center + h_frame
+
+        pad_l = 0
+        pad_r = 0
+
+        if s0 < 0:
+            pad_l = -s0
+            s0 = 0
+
+        if s1 >= N:
+            pad_r = s1 - N + 1
+            s1 = N - 1
+
+        slices.append((center, s0, s1, pad_l, pad_r))
+
+    return slices
+
+
+#-----------------------------------------------------------------------------
+# cases
+
+
+def stft_cases(quick = False):
+    """
+    Returns a list of (name, n_samples, config) Stft benchmark cases.
+    """
+
+    durations = [1.0, 30.0]
+    sample_rates = [8000.0, 48000.0]
+    windows = ['gaussian', 'hann', 'blackmanharris', 'kaiser']
+
+    # (t_step, f_step, t_sigma)
+
+    resolutions = [
+        (0.010, 16.666, 0.010),
+        (0.002, 50.0, 0.003),
+        (0.020, 5.0, 0.040),
+    ]
+
+    if quick:
+        durations = [1.0]
+        sample_rates = [8000.0]
+        windows = ['gaussian', 'hann']
+        resolutions = resolutions[: 2]
+
+    cases = []
+
+    for dur, sr, window, (t_step, f_step, t_sigma) in itertools.product(
+            durations, sample_rates, windows, resolutions):
+
+        cfg = stft.Stft.get_defaults()
+
+        cfg.update(
+            sample_rate = sr,
+            t_step = t_step,
+            f_step = f_step,
+            t_sigma = t_sigma,
+            window = window,
+        )
+
+        name = 'stft %gs %gHz %s step=%g f_step=%g sigma=%g' % (
+            dur, sr, window, t_step, f_step, t_sigma)
+
+        cases.append((name, int(dur * sr), cfg))
+
+    return cases
+
+
+def slice_cases(quick = False):
+    """
+    Returns a list of (name, N, frame_size, step) compute_sample_slices()
+    cases.
+    """
+
+    lengths = [8000, 480000, 4800000]
+
+    if quick:
+        lengths = lengths[: 2]
+
+    return [
+        ('slices N=%d frame=%d step=%d' % (N, frame, step), N, frame, step)
+        for N in lengths
+        for frame, step in [(512, 80), (2048, 16)]
+    ]
+
+
+#-----------------------------------------------------------------------------
+# measurement
+
+
+def measure(func, repeat = 3):
+    """
+    Calls func() repeat times, returns (result, best seconds, peak bytes
+    allocated during a call, peak rss bytes).  The allocations are traced in
+    one extra call, since tracing slows the calls down.
+    """
+
+    assert repeat > 0, "repeat <= 0"
+
+    best = None
+
+    for i in range(repeat):
+
+        result = None
+
+        t0 = time.perf_counter()
+        result = func()
+        secs = time.perf_counter() - t0
+
+        if best is None or secs < best:
+            best = secs
+
+    rss = peak_rss()
+
+    del result
+
+    tracemalloc.start()
+
+    try:
+        result = func()
+
+        current, peak = tracemalloc.get_traced_memory()
+
+    finally:
+        tracemalloc.stop()
+
+    return result, best, peak, rss
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in bytes.
+    """
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on linux, bytes on mac
+
+    if sys.platform != 'darwin':
+        rss *= 1024
+
+    return rss
+
+
+def run_stft_case(name, n_samples, cfg, repeat = 3, seed = 0):
+    """
+    Benchmarks one Stft case and checks it against reference_stft(), returns
+    a result dict.
+    """
+
+    signal = np.random.RandomState(seed).randn(n_samples).astype(np.float32)
+
+    stft_op = stft.Stft(**cfg)
+
+    data, secs, alloc, rss = measure(
+        lambda : stft_op(signal = signal, sample_rate = cfg['sample_rate']),
+        repeat,
+    )
+
+    ref_spec, ref_time = reference_stft(stft_op, signal)
+
+    spec = data['stft_spec']
+
+    scale = max(np.max(np.abs(ref_spec)), np.finfo(np.float64).tiny)
+
+    max_err = float(np.max(np.abs(spec - ref_spec)) / scale)
+
+    n_frames = len(ref_spec)
+
+    ok = (
+        spec.shape == ref_spec.shape
+        and np.array_equal(data['stft_time_axis'], ref_time)
+        and max_err <= TOLERANCE[cfg['precision']]
+    )
+
+    return dict(
+        name = name,
+        n_frames = n_frames,
+        seconds = secs,
+        frames_per_s = n_frames / secs,
+        alloc_bytes = alloc,
+        peak_rss = rss,
+        max_err = max_err,
+        ok = bool(ok),
+    )
+
+
+def run_slice_case(name, N, frame_size, step, repeat = 3):
+    """
+    Benchmarks compute_sample_slices() and checks it against
+    reference_sample_slices(), returns a result dict.
+    """
+
+    slices, secs, alloc, rss = measure(
+        lambda : stft.compute_sample_slices(N, frame_size, step),
+        repeat,
+    )
+
+    ref = np.array(reference_sample_slices(N, frame_size, step), np.int64)
+
+    got = np.stack([slices[f] for f in slices.dtype.names], axis = -1)
+
+    ok = got.shape == ref.shape and np.array_equal(got, ref)
+
+    return dict(
+        name = name,
+        n_frames = len(ref),
+        seconds = secs,
+        frames_per_s = len(ref) / secs,
+        alloc_bytes = alloc,
+        peak_rss = rss,
+        max_err = 0.0 if ok else float('inf'),
+        ok = bool(ok),
+    )
+
+
+def run(quick = False, repeat = 3, callback = None):
+    """
+    Runs all cases, returns the list of result dicts.  callback(result) is
+    called after each case.
+    """
+
+    results = []
+
+    jobs = [
+        (run_slice_case, case + (repeat,)) for case in slice_cases(quick)
+    ] + [
+        (run_stft_case, case + (repeat,)) for case in stft_cases(quick)
+    ]
+
+    for func, args in jobs:
+
+        result = func(*args)
+
+        results.append(result)
+
+        if callback is not None:
+            callback(result)
+
+    return results
+
+
+#-----------------------------------------------------------------------------
+# baselines
+
+
+def save_results(filename, results):
+    """
+    Writes results to a json file, for compare_results() in a later run.
+    """
+
+    with open(filename, 'w') as fd:
+        json.dump(results, fd, indent = 1)
+
+
+def load_results(filename):
+
+    with open(filename, 'r') as fd:
+        return json.load(fd)
+
+
+def compare_results(results, baseline, max_slowdown = 1.25, min_seconds = 1e-3):
+    """
+    Returns a list of (name, baseline seconds, seconds) for the cases that
+    are more than max_slowdown times slower than in baseline.  Cases faster
+    than min_seconds in both runs are too noisy to compare and are skipped.
+    """
+
+    base = {r['name'] : r for r in baseline}
+
+    slow = []
+
+    for r in results:
+
+        b = base.get(r['name'])
+
+        if b is None or max(r['seconds'], b['seconds']) < min_seconds:
+            continue
+
+        if r['seconds'] > max_slowdown * b['seconds']:
+            slow.append((r['name'], b['seconds'], r['seconds']))
+
+    return slow
@@ -0,0 +1,130 @@
+"""
+Chirp-z transform
+
+Evaluates the dft of real or complex frames at m frequencies evenly spaced
+over [fmin, fmax] with Bluestein's algorithm, as one convolution computed by
+two fft's of size >= n + m - 1.  A narrow band at fine resolution costs about
+as much as an fft of the frame size, instead of an fft large enough to space
+bins that closely over the whole band.
+
+With the same sample convention as np.fft.rfft():
+
+    X[k] = sum_n x[n] * exp(-2j * pi * f[k] * n / sample_rate)
+
+    f[k] = fmin + k * (fmax - fmin) / (m - 1)
+"""
+
+import numpy as np
+
+
+from sdaudio import assert_py3
+from sdaudio import fft_backend
+
+
+class ChirpZ(object):
+    '''
+    A chirp-z transform of n point frames to m bins over [fmin, fmax] Hz.
+    The chirps are precomputed, calling it transforms a batch of frames along
+    the last axis.
+    '''
+
+    def __init__(
+        self,
+        n,
+        m,
+        fmin,
+        fmax,
+        sample_rate,
+        fft_size = None,
+        dtype = np.complex64,
+        backend = None):
+
+        assert n > 0, "n <= 0"
+        assert m > 0, "m <= 0"
+        assert sample_rate > 0, "sample_rate <= 0"
+        assert fmax >= fmin, "fmax < fmin"
+
+        if fft_size is None:
+            fft_size = 1 << int(np.ceil(np.log2(n + m - 1)))
+
+        assert fft_size >= n + m - 1, "fft_size < n + m - 1"
+
+        if backend is None:
+            backend = fft_backend.get_backend('numpy')
+
+        df = 0.0
+
+        if m > 1:
+            df = (fmax - fmin) / float(m - 1)
+
+        #---------------------------------------------------------------------
+        # n * k = (n ** 2 + k ** 2 - (k - n) ** 2) / 2, phases in float64
+
+        def chirp(i):
+            i = np.asarray(i, np.float64)
+            return np.exp(1j * np.pi * df / sample_rate * i * i)
+
+        n_idx = np.arange(n)
+
+        # input chirp, includes the shift to fmin
+
+        pre = np.exp(-2j * np.pi * fmin / sample_rate * n_idx) * np.conj(chirp(n_idx))
+
+        # convolution kernel for lags -(n - 1) .. m - 1, wrapped around
+
+        v = np.zeros(fft_size, np.complex128)
+        v[: m] = chirp(np.arange(m))
+        v[fft_size - n + 1 :] = chirp(np.arange(n - 1, 0, -1))
+
+        self._n = n
+        self._m = m
+        self._fft_size = fft_size
+        self._fft = backend
+        self._pre = pre.astype(dtype)
+        self._kernel = backend.fft(v).astype(dtype)
+        self._post = np.conj(chirp(np.arange(m))).astype(dtype)
+        self._freq_axis = (fmin + df * np.arange(m)).astype(np.float32)
+
+        for a in [self._pre, self._kernel, self._post, self._freq_axis]:
+            a.setflags(write = False)
+
+
+    @property
+    def freq_axis(self):
+        return self._freq_axis
+
+
+    @property
+    def fft_size(self):
+        return self._fft_size
+
+
+    def __call__(self, x):
+        '''
+        Transforms x (..., n) into (..., m).
+        '''
+
+        assert x.shape[-1] == self._n, "x has the wrong frame size"
+
+        y = self._fft.fft(x * self._pre, n = self._fft_size, axis = -1)
+
+        y *= self._kernel
+
+        y = self._fft.ifft(y, axis = -1)
+
+        out = y[..., : self._m]
+
+        out *= self._post
+
+        return out
+
+
+def czt(x, m, fmin, fmax, sample_rate):
+    """
+    Evaluates the dft of x along the last axis at m frequencies evenly spaced
+    over [fmin, fmax], see ChirpZ.
+    """
+
+    op = ChirpZ(x.shape[-1], m, fmin, fmax, sample_rate, dtype = np.complex128)
+
+    return op(x)
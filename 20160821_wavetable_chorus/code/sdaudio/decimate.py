@@ -0,0 +1,310 @@
+"""
+Decimation
+
+Low-pass filters and keeps every q-th sample, so a signal that only matters
+below fmax can be analysed at a rate of about 2 * fmax instead of the
+recording rate.
+
+The filter is a linear phase kaiser windowed sinc centered on each kept
+sample, so output sample m is aligned with input sample m * q:
+
+    y[m] = sum_j h[j] * x[m * q + c - j],   len(h) = 2 * c + 1
+
+Only the kept samples are computed (the polyphase form): the input is
+reshaped into rows of q samples, one matrix product with the taps split into
+rows gives every row's partial sums, and each output sums 2 * c / q + 1 of
+them.  Samples outside the signal are zeros.  The
+passband ends at `passband` times the new nyquist frequency, the transition
+band spans the rest up to the new nyquist, where the stopband attenuation is
+reached.  Content in the transition band may alias into it, never into the
+passband.
+"""
+
+import functools
+
+import numpy as np
+
+
+from sdaudio import assert_py3
+
+
+PASSBAND = 0.8
+
+ATTENUATION_DB = 80.0
+
+# number of kept samples computed per matrix product, small enough for the
+# partial sums to stay in cache
+
+_CHUNK_SAMPLES = 2 ** 16
+
+
+@functools.lru_cache(maxsize = 32)
+def design_lowpass(q, passband = PASSBAND, attenuation_db = ATTENUATION_DB):
+    """
+    Returns the read only float64 taps of the decimation filter for factor q,
+    with 2 * c + 1 taps where c is a multiple of q, normalized to unit gain
+    at DC.
+    """
+
+    assert q > 1, "q <= 1"
+    assert 0.0 < passband < 1.0, "need 0 < passband < 1"
+
+    # normalized to the input rate, cycles per sample
+
+    nyquist = 0.5 / q
+
+    width = (1.0 - passband) * nyquist
+    cutoff = (1.0 + passband) * 0.5 * nyquist
+
+    # kaiser's estimates
+
+    A = attenuation_db
+
+    if A > 50.0:
+        beta = 0.1102 * (A - 8.7)
+
+    elif A > 21.0:
+        beta = 0.5842 * (A - 21.0) ** 0.4 + 0.07886 * (A - 21.0)
+
+    else:
+        beta = 0.0
+
+    n_taps = (A - 7.95) / (2.285 * 2.0 * np.pi * width) + 1.0
+
+    c = q * int(np.ceil(n_taps / (2.0 * q)))
+
+    n = np.arange(-c, c + 1)
+
+    h = 2.0 * cutoff * np.sinc(2.0 * cutoff * n) * np.kaiser(2 * c + 1, beta)
+
+    h /= np.sum(h)
+
+    h.setflags(write = False)
+
+    return h
+
+
+def choose_factor(sample_rate, fmax, step = None, passband = PASSBAND):
+    """
+    Returns the largest decimation factor that keeps fmax in the passband,
+    limited to the divisors of step if given, so frames of step input
+    samples stay an integer number of decimated samples apart.
+    """
+
+    assert sample_rate > 0, "sample_rate <= 0"
+    assert fmax > 0, "fmax <= 0"
+
+    q = max(1, int(passband * sample_rate / (2.0 * fmax)))
+
+    if step is not None:
+        while step % q != 0:
+            q -= 1
+
+    return q
+
+
+def frame_cost(q, step, n):
+    """
+    Rough operation count per frame of frames of n points every step input
+    samples, after decimating by q, weighted for numpy's per element
+    overhead like sdaudio.sdft.frame_cost().  The filter's share is one
+    matrix product over the frame's step input samples plus a numpy add per
+    kept sample and tap row, q = 1 is the fft alone.
+    """
+
+    assert q >= 1, "q < 1"
+
+    fft = 2.5 * n * np.log2(n)
+
+    if q == 1:
+        return fft
+
+    n_rows = len(design_lowpass(q)) / float(q)
+
+    return step * n_rows * (0.8 + 3.0 / q) + fft
+
+
+class Decimator(object):
+    '''
+    Decimates a signal by q along the last axis, in one call or block by
+    block.  The blocks are treated as one continuous signal, the
+    concatenation of all push() and flush() outputs is identical to
+    decimate() on the concatenation of all blocks.
+
+    The taps, buffered input and output are of the float dtype, the input
+    is converted to it.
+    '''
+
+    def __init__(
+        self,
+        q,
+        passband = PASSBAND,
+        attenuation_db = ATTENUATION_DB,
+        dtype = np.float32):
+
+        assert q > 1, "q <= 1"
+        assert np.issubdtype(dtype, np.floating), "dtype must be a float type"
+
+        taps = design_lowpass(q, passband, attenuation_db)
+
+        self._q = q
+        self._c = len(taps) // 2
+        self._dtype = np.dtype(dtype)
+
+        # taps padded to whole rows of q, shape (2 * c / q + 1, q)
+
+        rows = np.zeros(len(taps) + q - 1, dtype)
+        rows[: len(taps)] = taps
+
+        self._tap_rows = rows.reshape(-1, q)
+
+        self.reset()
+
+
+    @property
+    def q(self):
+        return self._q
+
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+
+    def reset(self):
+        '''
+        Discards all buffered samples, the next push() starts a new signal.
+        '''
+
+        # buf holds the input starting at signal index buf_start, negative
+        # indices are the zeros before the signal.  Created by the first
+        # push() once the leading shape is known.
+
+        self._buf = None
+        self._buf_start = -self._c
+        self._n_received = 0
+        self._m = 0
+
+
+    def decimate(self, x):
+        '''
+        Returns the decimated x, ceil(n / q) samples along the last axis.
+        '''
+
+        self.reset()
+
+        y0 = self.push(x)
+        y1 = self.flush()
+
+        return np.concatenate([y0, y1], axis = -1)
+
+
+    def push(self, x):
+        '''
+        Appends x, returns the decimated samples it completed.
+        '''
+
+        x = np.asarray(x, self._dtype)
+
+        if self._buf is None:
+            self._buf = np.zeros(x.shape[:-1] + (self._c,), self._dtype)
+
+        assert self._buf.shape[:-1] == x.shape[:-1], "leading shape changed"
+
+        self._buf = np.concatenate([self._buf, x], axis = -1)
+        self._n_received += x.shape[-1]
+
+        # sample m needs the input up to m * q + c
+
+        m_end = max(self._m, (self._n_received - 1 - self._c) // self._q + 1)
+
+        return self._pop(m_end)
+
+
+    def flush(self):
+        '''
+        Ends the signal, returns the remaining decimated samples and resets.
+        '''
+
+        if self._buf is None:
+            return np.zeros(0, self._dtype)
+
+        m_end = -(-self._n_received // self._q)
+
+        self._buf = np.concatenate(
+            [self._buf, np.zeros(self._buf.shape[:-1] + (self._c + self._q,), self._dtype)],
+            axis = -1,
+        )
+
+        y = self._pop(m_end)
+
+        self.reset()
+
+        return y
+
+
+    def _pop(self, m_end):
+        '''
+        Computes samples [m, m_end) and drops the input no later sample needs.
+        '''
+
+        q, c = self._q, self._c
+
+        buf = self._buf
+
+        n_out = m_end - self._m
+
+        n_rows = len(self._tap_rows)
+
+        y = np.zeros(buf.shape[:-1] + (n_out,), self._dtype)
+
+        # sample m's window starts at signal index m * q - c
+
+        offset = self._m * q - c - self._buf_start
+
+        chunk = _CHUNK_SAMPLES
+
+        for m0 in range(0, n_out, chunk):
+
+            m1 = min(m0 + chunk, n_out)
+
+            n = m1 - m0
+
+            # the windows of samples [m0, m1) as rows of q, zero padded
+
+            seg = np.zeros(buf.shape[:-1] + ((n + n_rows - 1) * q,), self._dtype)
+
+            src = buf[..., offset + m0 * q : offset + m0 * q + seg.shape[-1]]
+
+            seg[..., : src.shape[-1]] = src
+
+            seg = seg.reshape(buf.shape[:-1] + (n + n_rows - 1, q))
+
+            # Z[k, i] is tap row k times row i, sample m0 + i sums Z[k, i + k]
+
+            Z = np.matmul(self._tap_rows, np.swapaxes(seg, -1, -2))
+
+            out = y[..., m0 : m1]
+
+            for k in range(n_rows):
+                out += Z[..., k, k : k + n]
+
+        self._m = m_end
+
+        drop = m_end * q - c - self._buf_start
+
+        self._buf = self._buf[..., drop :]
+        self._buf_start += drop
+
+        return y
+
+
+def decimate(x, q, dtype = np.float32):
+    """
+    Decimates x by q along the last axis in the float dtype, see Decimator.
+    """
+
+    if q == 1:
+        return np.asarray(x)
+
+    return Decimator(q, dtype = dtype).decimate(x)
@@ -0,0 +1,132 @@
+"""
+FFT backends
+
+The Stft and Istft call rfft/irfft (and fft/ifft for the chirp-z zoom)
+through a backend object, so the FFT implementation can be selected at
+runtime:
+
+    numpy : numpy.fft, always available.  numpy >= 2.0 transforms float32
+            input in single precision, older versions always compute in
+            double precision.
+
+    scipy : scipy.fft, transforms float32 input in single precision and can
+            split batched transforms across threads with workers = N.
+
+get_backend('auto') picks scipy if it can be imported, else numpy.
+"""
+
+import numpy as np
+
+
+from sdaudio import assert_py3
+
+
+try:
+    import scipy.fft as _scipy_fft
+
+except ImportError:
+    _scipy_fft = None
+
+
+class NumpyBackend(object):
+    '''
+    Transforms with numpy.fft, the workers argument is ignored.
+    '''
+
+    name = 'numpy'
+
+    def __init__(self, workers = 1):
+        self._workers = workers
+
+
+    def rfft(self, x, n = None, axis = -1):
+        return np.fft.rfft(x, n = n, axis = axis)
+
+
+    def irfft(self, x, n = None, axis = -1):
+        return np.fft.irfft(x, n = n, axis = axis)
+
+
+    def fft(self, x, n = None, axis = -1):
+        return np.fft.fft(x, n = n, axis = axis)
+
+
+    def ifft(self, x, n = None, axis = -1):
+        return np.fft.ifft(x, n = n, axis = axis)
+
+
+class ScipyBackend(object):
+    '''
+    Transforms with scipy.fft using workers threads.
+    '''
+
+    name = 'scipy'
+
+    def __init__(self, workers = 1):
+
+        if _scipy_fft is None:
+            raise ImportError('scipy.fft is not available')
+
+        self._workers = workers
+
+
+    def rfft(self, x, n = None, axis = -1):
+        return _scipy_fft.rfft(x, n = n, axis = axis, workers = self._workers)
+
+
+    def irfft(self, x, n = None, axis = -1):
+        return _scipy_fft.irfft(x, n = n, axis = axis, workers = self._workers)
+
+
+    def fft(self, x, n = None, axis = -1):
+        return _scipy_fft.fft(x, n = n, axis = axis, workers = self._workers)
+
+
+    def ifft(self, x, n = None, axis = -1):
+        return _scipy_fft.ifft(x, n = n, axis = axis, workers = self._workers)
+
+
+BACKENDS = dict(
+    numpy = NumpyBackend,
+    scipy = ScipyBackend,
+)
+
+
+def available():
+    """
+    Returns the names of the backends that can be used.
+    """
+
+    names = ['numpy']
+
+    if _scipy_fft is not None:
+        names.append('scipy')
+
+    return names
+
+
+def get_backend(name = 'auto', workers = 1):
+    """
+    Returns an fft backend by name, one of: ['auto', 'numpy', 'scipy']
+    """
+
+    assert workers is None or workers > 0, "workers <= 0"
+
+    if workers is None:
+        workers = 1
+
+    if name == 'auto':
+        name = available()[-1]
+
+    if name not in BACKENDS:
+        raise ValueError('unknown fft backend "%s"' % name)
+
+    return BACKENDS[name](workers)
+
+
+def result_dtype(backend, dtype):
+    """
+    Returns the complex dtype the backend produces for real input of dtype.
+    """
+
+    return backend.rfft(np.zeros(2, dtype)).dtype
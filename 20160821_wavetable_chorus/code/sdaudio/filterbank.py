@@ -0,0 +1,217 @@
+"""
+Mel and log-frequency filterbanks
+
+Triangular filterbanks that project stft spectra (..., n_freq) onto
+(..., n_bands).  Each triangle only covers a few neighbouring fft bins, so the
+filterbank is stored as a sparse banded matrix in compressed row form: the
+non zero weights of all bands are packed into one array and projecting a
+chunk of frames is a gather, a multiply and one np.add.reduceat() call.
+
+Filterbanks are cached by (kind, sample_rate, nfft, n_bands, fmin, fmax), see
+get_filterbank().
+"""
+
+import functools
+
+import numpy as np
+
+
+from sdaudio import assert_py3
+
+
+KINDS = ['mel', 'log']
+
+
+def hz_to_mel(f):
+    """
+    Converts Hz to mel, the HTK formula.
+    """
+    return 2595.0 * np.log10(1.0 + np.asarray(f, np.float64) / 700.0)
+
+
+def mel_to_hz(m):
+    """
+    Converts mel to Hz, the HTK formula.
+    """
+    return 700.0 * (10.0 ** (np.asarray(m, np.float64) / 2595.0) - 1.0)
+
+
+class Filterbank(object):
+    '''
+    A sparse triangular filterbank over the bins of an nfft point rfft.
+
+    Band i rises linearly from edges[i] to a peak of 1 at edges[i + 1] and
+    falls back to 0 at edges[i + 2].  Band rows are stored as:
+
+        indptr : band i owns entries [indptr[i], indptr[i + 1])
+        indices : the fft bin of each entry
+        weights : the weight of each entry
+    '''
+
+    def __init__(self, kind, sample_rate, nfft, n_bands, fmin = 0.0, fmax = None):
+
+        nyquist = sample_rate / 2.0
+
+        if fmax is None:
+            fmax = nyquist
+
+        assert kind in KINDS, "kind must be one of %s" % KINDS
+        assert sample_rate > 0, "sample_rate <= 0"
+        assert nfft > 0, "nfft <= 0"
+        assert n_bands > 0, "n_bands <= 0"
+        assert 0.0 <= fmin < fmax <= nyquist, "need 0 <= fmin < fmax <= nyquist"
+
+        if kind == 'log':
+            assert fmin > 0.0, "fmin must be > 0 for a log filterbank"
+
+        #---------------------------------------------------------------------
+        # band edges, evenly spaced on the mel or log scale
+
+        if kind == 'mel':
+            edges = mel_to_hz(np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_bands + 2))
+
+        else:
+            edges = np.geomspace(fmin, fmax, n_bands + 2)
+
+        bin_freqs = np.arange(nfft // 2 + 1) * (sample_rate / float(nfft))
+
+        #---------------------------------------------------------------------
+        # pack the non zero weights of each band
+
+        indptr = [0]
+        indices = []
+        weights = []
+
+        for i in range(n_bands):
+
+            lo, mid, hi = edges[i : i + 3]
+
+            k0 = np.searchsorted(bin_freqs, lo, side = 'right')
+            k1 = np.searchsorted(bin_freqs, hi, side = 'left')
+
+            f = bin_freqs[k0 : k1]
+
+            w = np.minimum((f - lo) / (mid - lo), (hi - f) / (hi - mid))
+
+            # bands narrower than a bin sample their peak from the nearest bin
+
+            if len(f) == 0:
+                k0 = min(int(np.round(mid * nfft / float(sample_rate))), nfft // 2)
+                k1 = k0 + 1
+                w = np.ones(1)
+
+            indices.append(np.arange(k0, k1))
+            weights.append(w)
+            indptr.append(indptr[-1] + k1 - k0)
+
+        self._kind = kind
+        self._nfft = nfft
+        self._n_freq = nfft // 2 + 1
+        self._indptr = np.array(indptr, np.int64)
+        self._indices = np.concatenate(indices).astype(np.int64)
+        self._weights = np.concatenate(weights).astype(np.float32)
+        self._center_freqs = edges[1 : -1].astype(np.float32)
+
+        for a in [self._indptr, self._indices, self._weights, self._center_freqs]:
+            a.setflags(write = False)
+
+
+    @property
+    def n_bands(self):
+        return len(self._center_freqs)
+
+
+    @property
+    def n_freq(self):
+        return self._n_freq
+
+
+    @property
+    def center_freqs(self):
+        return self._center_freqs
+
+
+    @property
+    def nnz(self):
+        return len(self._weights)
+
+
+    def to_dense(self):
+        '''
+        Returns the filterbank as a dense (n_bands, n_freq) matrix.
+        '''
+
+        out = np.zeros((self.n_bands, self._n_freq), np.float32)
+
+        rows = np.repeat(np.arange(self.n_bands), np.diff(self._indptr))
+
+        out[rows, self._indices] = self._weights
+
+        return out
+
+
+    def project(self, spec, out = None, chunk_frames = 1024):
+        '''
+        Projects the real spectrum spec (..., n_freq) onto the bands, returns
+        (..., n_bands).  Frames are projected in chunks of chunk_frames rows
+        so the gathered entries stay small.
+        '''
+
+        assert spec.shape[-1] == self._n_freq, "spec has the wrong number of bins"
+
+        shape = spec.shape[:-1] + (self.n_bands,)
+
+        if out is None:
+            out = np.zeros(shape, np.result_type(spec.dtype, np.float32))
+
+        assert out.shape == shape, "out has the wrong shape"
+
+        rows = spec.reshape(-1, self._n_freq)
+        dst = out.reshape(-1, self.n_bands)
+
+        for r0 in range(0, len(rows), chunk_frames):
+
+            r1 = min(r0 + chunk_frames, len(rows))
+
+            g = rows[r0 : r1, self._indices]
+
+            g *= self._weights
+
+            dst[r0 : r1] = np.add.reduceat(g, self._indptr[:-1], axis = 1)
+
+        # reshape() copies non contiguous outputs, write the result back
+
+        if not np.may_share_memory(dst, out):
+            out[...] = dst.reshape(shape)
+
+        return out
+
+
+    def __call__(self, **kwargs):
+        '''
+        inputs: stft_spec, stft_freq_axis
+        outputs: filterbank_spec, filterbank_freq_axis
+
+        stft_spec must be real valued, like the Stft 'magnitude' or 'power'
+        outputs.
+        '''
+
+        spec = kwargs['stft_spec']
+
+        assert not np.iscomplexobj(spec), "stft_spec must be real valued"
+        assert len(kwargs['stft_freq_axis']) == self._n_freq, "stft_freq_axis has the wrong length"
+
+        kwargs.update(
+            filterbank_spec = self.project(spec),
+            filterbank_freq_axis = np.array(self._center_freqs),
+        )
+
+        return kwargs
+
+
+@functools.lru_cache(maxsize = 64)
+def get_filterbank(kind, sample_rate, nfft, n_bands, fmin = 0.0, fmax = None):
+    """
+    Returns a shared Filterbank, cached by its arguments.
+    """
+    return Filterbank(kind, sample_rate, nfft, n_bands, fmin, fmax)
@@ -0,0 +1,731 @@
+"""
+Spectrogram movie frames
+
+Renders the frames of a scrolling spectrogram movie, a window of `width`
+seconds centered on the current time with a cursor line at the center.
+
+Matplotlib is only used once, to draw the static parts of the frame (axes,
+frequency ticks, labels) into a background image.  The colour mapped
+spectrogram and the time axis ticks below it are rasterized once into RGB
+pixel arrays at the movie's pixels per second, so every frame is:
+
+    the background
+    + a crop of the spectrogram raster
+    + a crop of the time axis raster
+    + the cursor line
+    + the title text, blended from a glyph atlas
+
+all drawn with numpy.  The crop is rounded to whole pixels, the scroll
+position may be off by up to half a pixel.
+"""
+
+import multiprocessing
+import multiprocessing.shared_memory as shared_memory
+import os
+
+import numpy as np
+
+
+from sdaudio import assert_py3
+
+
+# the frame layout, as fractions of the frame size like
+# matplotlib.rcParams['figure.subplot.*']
+
+LAYOUT = dict(
+    left = 0.09,
+    bottom = 0.15,
+    right = 0.97,
+    top = 0.88,
+)
+
+# number of raster columns colour mapped per chunk
+
+_CHUNK_COLUMNS = 4096
+
+
+def _lut(cmap):
+    """
+    Returns the (256, 3) uint8 RGB table of a matplotlib colormap.
+    """
+
+    import matplotlib.pyplot as plt
+
+    cmap = plt.get_cmap(cmap, 256)
+
+    rgb = cmap(np.arange(256))[:, : 3]
+
+    return np.round(rgb * 255.0).astype(np.uint8)
+
+
+def _rgb(color):
+    """
+    Returns a matplotlib color as a float32 RGB array in [0, 255].
+    """
+
+    import matplotlib.colors
+
+    return 255.0 * np.array(matplotlib.colors.to_rgb(color), np.float32)
+
+
+def _nearest(axis, values):
+    """
+    Returns the index of the nearest axis bin for each value, -1 outside the
+    first and last bins.  The bins extend half way to their neighbours, like
+    imshow with an extent.
+    """
+
+    axis = np.asarray(axis, np.float64)
+
+    if len(axis) == 1:
+        return np.zeros(len(values), np.int64)
+
+    mid = 0.5 * (axis[1 :] + axis[: -1])
+
+    lo = axis[0] - (mid[0] - axis[0])
+    hi = axis[-1] + (axis[-1] - mid[-1])
+
+    idx = np.searchsorted(mid, values)
+
+    idx[(values < lo) | (values >= hi)] = -1
+
+    return idx
+
+
+class GlyphAtlas(object):
+    '''
+    Bitmaps of a set of characters in a monospace font, rendered once with
+    matplotlib and blended into RGB frames with numpy.
+    '''
+
+    def __init__(self, chars, fontsize = 10.0, dpi = 100.0):
+
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        from matplotlib.font_manager import FontProperties
+
+        chars = sorted(set(chars))
+
+        prop = FontProperties(family = 'monospace', size = fontsize)
+
+        #---------------------------------------------------------------------
+        # the advance of a monospace glyph, from a run of glyphs
+
+        fig = Figure(figsize = (1, 1), dpi = dpi)
+        canvas = FigureCanvasAgg(fig)
+
+        renderer = canvas.get_renderer()
+
+        w, h, d = renderer.get_text_width_height_descent('0' * 16, prop, False)
+
+        advance = max(1, int(np.round(w / 16.0)))
+
+        # one cell per glyph, a little wider than the advance so glyphs that
+        # overhang it are not cut
+
+        pad = max(1, advance // 4)
+
+        cell_w = advance + 2 * pad
+        cell_h = int(np.ceil(1.5 * fontsize * dpi / 72.0))
+
+        baseline = int(np.round(0.3 * cell_h))
+
+        #---------------------------------------------------------------------
+        # render all glyphs black on white in one row of cells
+
+        width = cell_w * len(chars)
+
+        fig = Figure(figsize = (width / dpi, cell_h / dpi), dpi = dpi)
+        fig.patch.set_facecolor('white')
+
+        canvas = FigureCanvasAgg(fig)
+
+        for i, c in enumerate(chars):
+            fig.text(
+                (i * cell_w + pad) / float(width),
+                baseline / float(cell_h),
+                c,
+                fontproperties = prop,
+                color = 'black',
+                ha = 'left',
+                va = 'baseline',
+            )
+
+        canvas.draw()
+
+        gray = np.asarray(canvas.buffer_rgba())[:, :, 0].astype(np.float32)
+
+        coverage = 1.0 - gray / 255.0
+
+        self._glyphs = {
+            c : np.ascontiguousarray(coverage[:, i * cell_w : (i + 1) * cell_w])
+            for i, c in enumerate(chars)
+        }
+
+        self._advance = advance
+        self._pad = pad
+        self._height = cell_h
+        self._ascent = cell_h - baseline
+
+
+    @property
+    def height(self):
+        return self._height
+
+
+    @property
+    def ascent(self):
+        '''
+        The rows of a cell above the baseline.
+        '''
+        return self._ascent
+
+
+    def text_width(self, text):
+        '''
+        Returns the width in pixels of text.
+        '''
+        return self._advance * len(text)
+
+
+    def draw(self, frame, text, x, y, color = 'black', ha = 'left'):
+        '''
+        Blends text into the RGB frame (H, W, 3) with its baseline on row y,
+        starting at column x, or centered on x if ha is 'center'.  Glyphs
+        outside the frame are clipped.
+        '''
+
+        assert ha in ['left', 'center'], "ha must be 'left' or 'center'"
+
+        rgb = _rgb(color)
+
+        if ha == 'center':
+            x -= self.text_width(text) // 2
+
+        y0 = y - self._ascent
+
+        H, W = frame.shape[: 2]
+
+        for i, c in enumerate(text):
+
+            glyph = self._glyphs.get(c)
+
+            if glyph is None:
+                raise KeyError('character %s is not in the atlas' % repr(c))
+
+            gx = x + i * self._advance - self._pad
+
+            # clip to the frame
+
+            r0 = max(0, y0)
+            r1 = min(H, y0 + glyph.shape[0])
+            c0 = max(0, gx)
+            c1 = min(W, gx + glyph.shape[1])
+
+            if r1 <= r0 or c1 <= c0:
+                continue
+
+            a = glyph[r0 - y0 : r1 - y0, c0 - gx : c1 - gx, np.newaxis]
+
+            region = frame[r0 : r1, c0 : c1]
+
+            region[...] = region + (rgb - region) * a + 0.5
+
+
+class SpectrogramMovie(object):
+    '''
+    Renders the frames of a scrolling spectrogram movie.
+
+    spec : the spectrogram (n_frames, n_freq), may be a memory map
+    time_axis : the stft time axis in seconds (n_frames)
+    freq_axis : the stft frequency axis in Hz (n_freq)
+    duration : the length of the audio in seconds
+    width : the seconds of audio displayed per frame
+    fps : the movie frame rate
+    size : the frame size in pixels, (width, height)
+    fmax : the top of the frequency axis, defaults to the last bin
+    vmin, vmax : the colour map range, default to the spectrogram's range
+    raster_path : if given, the rasters are written to this .npy file and
+        memory mapped, so worker processes share them, see render_parallel()
+    '''
+
+    def __init__(
+        self,
+        spec,
+        time_axis,
+        freq_axis,
+        duration,
+        width = 6.0,
+        fps = 60.0,
+        size = (1280, 720),
+        fmax = None,
+        cmap = 'bone',
+        vmin = None,
+        vmax = None,
+        dpi = 100.0,
+        raster_path = None):
+
+        assert spec.ndim == 2, "spec must be 2D (n_frames, n_freq)"
+        assert spec.shape == (len(time_axis), len(freq_axis)), "spec does not match the axes"
+        assert duration > 0, "duration <= 0"
+        assert width > 0, "width <= 0"
+        assert fps > 0, "fps <= 0"
+
+        if fmax is None:
+            fmax = freq_axis[-1]
+
+        if vmin is None:
+            vmin = float(np.min(spec))
+
+        if vmax is None:
+            vmax = float(np.max(spec))
+
+        self._duration = float(duration)
+        self._width = float(width)
+        self._fps = float(fps)
+        self._size = (int(size[0]), int(size[1]))
+        self._dpi = float(dpi)
+
+        ylim = (float(freq_axis[0]), float(fmax))
+
+        self._draw_background(ylim)
+
+        x0, x1, y0, y1 = self._plot_rect
+
+        self._pixels_per_second = (x1 - x0) / self._width
+
+        self._tick_atlas = GlyphAtlas('0123456789.-', 10.0, dpi)
+        self._title_atlas = GlyphAtlas('Time=0123456789.-seconds ', 12.0, dpi)
+
+        # raster column j is centered on time t_start + (j + 0.5) / pps,
+        # covering every window from t = 0 to t = duration
+
+        self._t_start = -0.5 * self._width
+
+        n_cols = int(np.ceil((self._duration + self._width) * self._pixels_per_second)) + (x1 - x0)
+
+        # the spectrogram rows with the time axis rows below them
+
+        n_rows = y1 - y0
+
+        shape = (n_rows + self._tick_height, n_cols, 3)
+
+        if raster_path is None:
+            raster = np.zeros(shape, np.uint8)
+
+        else:
+            raster = np.lib.format.open_memmap(raster_path, 'w+', np.uint8, shape)
+
+        self._draw_raster(raster[: n_rows], spec, time_axis, freq_axis, ylim, cmap, vmin, vmax)
+        self._draw_ticks(raster[n_rows :])
+
+        if raster_path is not None:
+            raster.flush()
+            del raster
+            raster = np.load(raster_path, mmap_mode = 'r')
+
+        self._raster = raster
+        self._raster_path = raster_path
+
+
+    @property
+    def size(self):
+        return self._size
+
+
+    @property
+    def fps(self):
+        return self._fps
+
+
+    @property
+    def n_frames(self):
+        return int(np.ceil(self._duration * self._fps))
+
+
+    @property
+    def pixels_per_second(self):
+        return self._pixels_per_second
+
+
+    @property
+    def background(self):
+        return self._background
+
+
+    def frame_time(self, i):
+        '''
+        Returns the time in seconds of frame i.
+        '''
+        return i / self._fps
+
+
+    def render(self, t, out = None):
+        '''
+        Returns the RGB frame (H, W, 3) uint8 for time t.  out is reused if
+        given, it must hold an earlier frame of this movie or a copy of the
+        background, only the parts that change are redrawn.
+        '''
+
+        if out is None:
+            out = self._background.copy()
+
+        x0, x1, y0, y1 = self._plot_rect
+
+        w = x1 - x0
+
+        c0 = int(np.round((t - 0.5 * self._width - self._t_start) * self._pixels_per_second))
+        c0 = min(max(c0, 0), self._raster.shape[1] - w)
+
+        n_rows = y1 - y0
+
+        out[y0 : y1, x0 : x1] = self._raster[: n_rows, c0 : c0 + w]
+
+        ty = self._tick_top
+
+        out[ty : ty + self._tick_height, x0 : x1] = self._raster[n_rows :, c0 : c0 + w]
+
+        # cursor
+
+        lw = max(1, int(np.round(1.5 * self._dpi / 72.0)))
+
+        xc = x0 + w // 2 - lw // 2
+
+        out[y0 : y1, xc : xc + lw] = (255, 0, 0)
+
+        # title, centered above the plot
+
+        ty0, ty1 = self._title_rows
+
+        out[ty0 : ty1] = self._background[ty0 : ty1]
+
+        self._title_atlas.draw(
+            out,
+            'Time = %.2f seconds' % t,
+            x0 + w // 2,
+            ty1 - self._title_descent,
+            ha = 'center',
+        )
+
+        return out
+
+
+    def frames(self, i0 = 0, i1 = None):
+        '''
+        Yields (i, frame) for frames [i0, i1).  The same buffer is reused for
+        every frame, copy it to keep it.
+        '''
+
+        if i1 is None:
+            i1 = self.n_frames
+
+        out = None
+
+        for i in range(i0, i1):
+
+            out = self.render(self.frame_time(i), out)
+
+            yield i, out
+
+
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+
+        # a memory mapped raster is reopened from its file, not copied
+
+        if self._raster_path is not None:
+            state['_raster'] = None
+
+        return state
+
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+
+        if self._raster_path is not None:
+            self._raster = np.load(self._raster_path, mmap_mode = 'r')
+
+
+    #-------------------------------------------------------------------------
+    # internals
+
+    def _draw_background(self, ylim):
+        '''
+        Draws the static parts of the frame with matplotlib.
+        '''
+
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        W, H = self._size
+        dpi = self._dpi
+
+        fig = Figure(figsize = (W / dpi, H / dpi), dpi = dpi)
+        fig.patch.set_facecolor('white')
+
+        canvas = FigureCanvasAgg(fig)
+
+        ax = fig.add_axes([
+            LAYOUT['left'],
+            LAYOUT['bottom'],
+            LAYOUT['right'] - LAYOUT['left'],
+            LAYOUT['top'] - LAYOUT['bottom'],
+        ])
+
+        ax.set_facecolor('black')
+        ax.set_ylim(ylim)
+        ax.set_xticks([])
+        ax.set_ylabel('Frequency (Hz)')
+
+        # room for the time ticks, drawn per frame 2 rows below the spine,
+        # plus a margin above the label
+
+        tick_h = int(np.ceil(3.5 * dpi / 72.0)) + int(np.ceil(1.6 * 10.0 * dpi / 72.0))
+
+        margin = int(np.ceil(3.0 * dpi / 72.0))
+
+        ax.set_xlabel('Time (s)', labelpad = (tick_h + 2 + margin) * 72.0 / dpi)
+
+        canvas.draw()
+
+        self._background = np.array(np.asarray(canvas.buffer_rgba())[:, :, : 3])
+        self._background.setflags(write = False)
+
+        # the inside of the axes spines, in rows from the top
+
+        bbox = ax.get_window_extent()
+
+        x0 = int(np.ceil(bbox.x0)) + 1
+        x1 = int(np.floor(bbox.x1)) - 1
+        y0 = H - int(np.floor(bbox.y1)) + 1
+        y1 = H - int(np.ceil(bbox.y0)) - 1
+
+        self._plot_rect = (x0, x1, y0, y1)
+
+        # the time axis, below the bottom spine
+
+        self._tick_top = H - int(np.floor(bbox.y0)) + 2
+        self._tick_height = tick_h
+
+        label_top = H - int(np.ceil(ax.xaxis.label.get_window_extent().y1))
+
+        assert self._tick_top + tick_h <= label_top, "the time axis overlaps the xlabel"
+
+        # the title band, between the top of the frame and the axes
+
+        self._title_descent = int(np.round(6.0 * dpi / 72.0))
+        self._title_rows = (0, y0 - 1)
+
+
+    def _draw_raster(self, raster, spec, time_axis, freq_axis, ylim, cmap, vmin, vmax):
+        '''
+        Colour maps the spectrogram into the zeroed raster (plot height,
+        n_cols, 3), leaving black outside the spectrogram.
+        '''
+
+        n_rows, n_cols = raster.shape[: 2]
+
+        lut = _lut(cmap)
+
+        # the frequency at the center of each pixel row, top row first
+
+        f = ylim[1] - (np.arange(n_rows) + 0.5) * (ylim[1] - ylim[0]) / n_rows
+
+        rows = _nearest(freq_axis, f)
+
+        scale = 256.0 / max(vmax - vmin, np.finfo(np.float32).tiny)
+
+        for j0 in range(0, n_cols, _CHUNK_COLUMNS):
+
+            j1 = min(j0 + _CHUNK_COLUMNS, n_cols)
+
+            t = self._t_start + (np.arange(j0, j1) + 0.5) / self._pixels_per_second
+
+            cols = _nearest(time_axis, t)
+
+            valid_c = np.nonzero(cols >= 0)[0]
+            valid_r = np.nonzero(rows >= 0)[0]
+
+            if len(valid_c) == 0 or len(valid_r) == 0:
+                continue
+
+            # (n_valid_rows, n_valid_cols) values, frames are read once
+
+            v = np.asarray(spec[cols[valid_c]])[:, rows[valid_r]].T
+
+            idx = np.clip((v - vmin) * scale, 0, 255).astype(np.intp)
+
+            block = raster[:, j0 : j1]
+
+            block[valid_r[:, np.newaxis], valid_c] = lut[idx]
+
+
+    def _draw_ticks(self, ticks):
+        '''
+        Draws the time axis, tick marks and labels in black on white, into
+        (tick height, n_cols, 3) pixels.
+        '''
+
+        import matplotlib.ticker
+
+        n_cols = ticks.shape[1]
+
+        ticks[...] = 255
+
+        pps = self._pixels_per_second
+
+        # the tick spacing matplotlib would pick for one window
+
+        values = matplotlib.ticker.MaxNLocator().tick_values(0.0, self._width)
+
+        spacing = float(values[1] - values[0])
+
+        tick_len = int(np.ceil(3.5 * self._dpi / 72.0))
+
+        t0 = self._t_start
+        t1 = self._t_start + n_cols / pps
+
+        atlas = self._tick_atlas
+
+        for k in range(int(np.ceil(t0 / spacing)), int(np.floor(t1 / spacing)) + 1):
+
+            t = k * spacing
+
+            x = int(np.round((t - t0) * pps - 0.5))
+
+            if 0 <= x < n_cols:
+                ticks[: tick_len, x] = 0
+
+            label = ('%.6f' % t).rstrip('0').rstrip('.')
+
+            if label == '-0':
+                label = '0'
+
+            atlas.draw(ticks, label, x, tick_len + atlas.ascent - 2, ha = 'center')
+
+
+#-----------------------------------------------------------------------------
+# parallel rendering
+
+# the movie and frame slots of a worker process
+
+_WORKER = dict()
+
+
+def _init_worker(movie, shm_name, n_slots):
+
+    W, H = movie.size
+
+    shm = shared_memory.SharedMemory(name = shm_name)
+
+    _WORKER['movie'] = movie
+    _WORKER['shm'] = shm
+    _WORKER['slots'] = np.ndarray((n_slots, H, W, 3), np.uint8, buffer = shm.buf)
+
+
+def _render_worker(job):
+    """
+    Renders frames [i0, i1) into the slots starting at slot.
+    """
+
+    i0, i1, slot = job
+
+    movie = _WORKER['movie']
+    slots = _WORKER['slots']
+
+    for k, i in enumerate(range(i0, i1)):
+        movie.render(movie.frame_time(i), slots[slot + k])
+
+
+def render_parallel(movie, n_workers = None, i0 = 0, i1 = None, chunksize = 4):
+    """
+    Renders frames [i0, i1) of movie in a pool of n_workers processes
+    (defaults to the number of cpus), yields (i, frame) in order like
+    SpectrogramMovie.frames().
+
+    The frames are rendered into slots of a shared memory block, so only
+    frame numbers pass between the processes.  The workers fill one half of
+    the slots, chunksize frames per job, while the caller consumes the
+    other half.  A frame is only valid until the next one is yielded, copy
+    it to keep it.
+
+    Every worker gets the movie once.  Build it with raster_path so the
+    workers memory map the rasters instead of receiving a copy.
+    """
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    assert n_workers > 0, "n_workers <= 0"
+    assert chunksize > 0, "chunksize <= 0"
+
+    if i1 is None:
+        i1 = movie.n_frames
+
+    if i1 <= i0:
+        return
+
+    W, H = movie.size
+
+    batch = n_workers * chunksize
+
+    n_slots = 2 * batch
+
+    shm = shared_memory.SharedMemory(create = True, size = n_slots * H * W * 3)
+
+    try:
+        slots = np.ndarray((n_slots, H, W, 3), np.uint8, buffer = shm.buf)
+
+        # render() only redraws what changes, every slot starts as the
+        # background
+
+        slots[...] = movie.background
+
+        batches = [(b, min(b + batch, i1)) for b in range(i0, i1, batch)]
+
+        with multiprocessing.Pool(
+                n_workers, _init_worker, (movie, shm.name, n_slots)) as pool:
+
+            def submit(k):
+
+                b0, b1 = batches[k]
+
+                half = (k % 2) * batch
+
+                jobs = [
+                    (j0, min(j0 + chunksize, b1), half + j0 - b0)
+                    for j0 in range(b0, b1, chunksize)
+                ]
+
+                return pool.map_async(_render_worker, jobs)
+
+            pending = submit(0)
+
+            for k, (b0, b1) in enumerate(batches):
+
+                pending.get()
+
+                if k + 1 < len(batches):
+                    pending = submit(k + 1)
+
+                half = (k % 2) * batch
+
+                for i in range(b0, b1):
+                    yield i, slots[half + i - b0]
+
+    finally:
+
+        slots = None
+
+        shm.unlink()
+
+        # the caller may still hold the last frame, the block is then freed
+        # with it
+
+        try:
+            shm.close()
+
+        except BufferError:
+            pass
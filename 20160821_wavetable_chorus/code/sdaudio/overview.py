@@ -0,0 +1,318 @@
+"""
+Waveform overview pyramid
+
+Computes min/max/rms summaries of a wavefile at several zoom levels in a
+single streaming pass and stores them in a small sidecar file next to the
+audio.  Any time range can then be drawn with a bounded number of points per
+channel without reading the audio again.
+
+Level 0 summarizes bins of `base` samples, each following level merges
+`factor` bins of the level below, until a level has at most `top_size` bins.
+"""
+
+import os.path
+
+import numpy as np
+
+
+from sdaudio import assert_py3
+from sdaudio import wavio
+
+
+VERSION = 1
+
+
+def sidecar_filename(wav_filename):
+    """
+    Returns the default sidecar filename for a wavefile.
+    """
+    return wav_filename + '.overview.npz'
+
+
+def build(
+    wav_filename,
+    out_filename = None,
+    base = 256,
+    factor = 4,
+    top_size = 1024,
+    block_size = 2 ** 16):
+    """
+    Reads wav_filename block by block and writes the overview pyramid to
+    out_filename (defaults to sidecar_filename(wav_filename)).
+
+    Returns the output filename.
+    """
+
+    assert base > 0, "base <= 0"
+    assert factor > 1, "factor <= 1"
+    assert top_size > 0, "top_size <= 0"
+
+    if out_filename is None:
+        out_filename = sidecar_filename(wav_filename)
+
+    #-------------------------------------------------------------------------
+    # level 0, streamed from the wavefile
+
+    mins = []
+    maxs = []
+    sums = []
+
+    carry = None
+    sr = None
+    n_samples = 0
+
+    for x, sr in wavio.read_blocks(wav_filename, block_size):
+
+        n_samples += len(x)
+
+        if carry is not None:
+            x = np.vstack([carry, x])
+
+        n_bins = len(x) // base
+
+        if n_bins > 0:
+
+            b = x[: n_bins * base].reshape(n_bins, base, x.shape[1])
+
+            mins.append(b.min(axis = 1))
+            maxs.append(b.max(axis = 1))
+            sums.append(np.sum(b.astype(np.float64) ** 2, axis = 1))
+
+        carry = x[n_bins * base :]
+
+    if sr is None:
+        raise wavio.WavIOError('No samples in data chunk: %s' % wav_filename)
+
+    # last partial bin
+
+    if len(carry) > 0:
+        mins.append(carry.min(axis = 0, keepdims = True))
+        maxs.append(carry.max(axis = 0, keepdims = True))
+        sums.append(np.sum(carry.astype(np.float64) ** 2, axis = 0, keepdims = True))
+
+    mn = np.concatenate(mins)
+    mx = np.concatenate(maxs)
+    ss = np.concatenate(sums)
+
+    #-------------------------------------------------------------------------
+    # higher levels, merged from the level below
+
+    levels = dict()
+
+    bin_size = base
+    level = 0
+
+    while True:
+
+        counts = _bin_counts(n_samples, bin_size, len(mn))
+
+        levels['min_%d' % level] = mn.astype(np.float16)
+        levels['max_%d' % level] = mx.astype(np.float16)
+        levels['rms_%d' % level] = np.sqrt(ss / counts[:, None]).astype(np.float16)
+
+        if len(mn) <= top_size:
+            break
+
+        mn = _merge(mn, factor, np.minimum)
+        mx = _merge(mx, factor, np.maximum)
+        ss = _merge(ss, factor, np.add)
+
+        bin_size *= factor
+        level += 1
+
+    np.savez(
+        out_filename,
+        version = VERSION,
+        sample_rate = sr,
+        n_samples = n_samples,
+        n_levels = level + 1,
+        base = base,
+        factor = factor,
+        **levels
+    )
+
+    # np.savez() appends .npz if missing
+
+    if not out_filename.endswith('.npz'):
+        out_filename += '.npz'
+
+    return out_filename
+
+
+def _bin_counts(n_samples, bin_size, n_bins):
+    counts = np.full(n_bins, bin_size, np.float64)
+    counts[-1] = n_samples - (n_bins - 1) * bin_size
+    return counts
+
+
+def _merge(x, factor, ufunc):
+    """
+    Reduces every `factor` consecutive rows of x with ufunc, the last group
+    may be partial.
+    """
+    starts = np.arange(0, len(x), factor)
+    return ufunc.reduceat(x, starts, axis = 0)
+
+
+class Overview(object):
+    '''
+    Reads an overview sidecar file and answers zoom queries from it.
+    '''
+
+    def __init__(self, filename):
+
+        if not os.path.isfile(filename):
+            raise IOError('File not found: %s' % filename)
+
+        with np.load(filename) as npz:
+
+            version = int(npz['version'])
+
+            if version != VERSION:
+                raise ValueError(
+                    'unsupported overview version %d in %s' % (version, filename))
+
+            self._sample_rate = float(npz['sample_rate'])
+            self._n_samples = int(npz['n_samples'])
+            self._base = int(npz['base'])
+            self._factor = int(npz['factor'])
+
+            n_levels = int(npz['n_levels'])
+
+            self._levels = []
+
+            for i in range(n_levels):
+                self._levels.append((
+                    npz['min_%d' % i],
+                    npz['max_%d' % i],
+                    npz['rms_%d' % i],
+                ))
+
+
+    @property
+    def sample_rate(self):
+        return self._sample_rate
+
+
+    @property
+    def duration(self):
+        return self._n_samples / self._sample_rate
+
+
+    @property
+    def n_levels(self):
+        return len(self._levels)
+
+
+    def query(self, t0 = None, t1 = None, max_points = 2000):
+        '''
+        Returns a dict with the overview for the time range [t0, t1) seconds
+        using the finest level that has at most max_points bins in the range.
+        If even the coarsest level has more, its bins are merged in groups
+        to fit:
+
+            time_axis : bin centers in seconds (shape N)
+            min : the minimum per bin (shape N, n_channels)
+            max : the maximum per bin (shape N, n_channels)
+            rms : the rms per bin (shape N, n_channels)
+            level : the pyramid level used
+        '''
+
+        assert max_points > 0, "max_points <= 0"
+
+        if t0 is None:
+            t0 = 0.0
+
+        if t1 is None:
+            t1 = self.duration
+
+        assert t1 > t0, "t1 <= t0"
+
+        s0 = max(0, int(np.floor(t0 * self._sample_rate)))
+        s1 = min(self._n_samples, int(np.ceil(t1 * self._sample_rate)))
+
+        s1 = max(s1, s0 + 1)
+
+        # pick the finest level that fits
+
+        level = len(self._levels) - 1
+
+        for i in range(len(self._levels)):
+
+            bin_size = self._base * self._factor ** i
+
+            n_bins = (s1 - 1) // bin_size - s0 // bin_size + 1
+
+            if n_bins <= max_points:
+                level = i
+                break
+
+        bin_size = self._base * self._factor ** level
+
+        mn, mx, rms = self._levels[level]
+
+        i0 = min(s0 // bin_size, len(mn) - 1)
+        i1 = min((s1 - 1) // bin_size + 1, len(mn))
+
+        centers = (np.arange(i0, i1) + 0.5) * bin_size
+
+        centers = np.minimum(centers, self._n_samples)
+
+        mn = mn[i0 : i1].astype(np.float32)
+        mx = mx[i0 : i1].astype(np.float32)
+        rms = rms[i0 : i1].astype(np.float32)
+
+        # even the coarsest level has too many bins, merge groups of them
+
+        if i1 - i0 > max_points:
+
+            group = -(-(i1 - i0) // max_points)
+
+            counts = _bin_counts(self._n_samples, bin_size, len(self._levels[level][0]))
+            counts = counts[i0 : i1, np.newaxis]
+
+            ss = _merge(rms.astype(np.float64) ** 2 * counts, group, np.add)
+            n = _merge(counts, group, np.add)
+
+            mn = _merge(mn, group, np.minimum)
+            mx = _merge(mx, group, np.maximum)
+            rms = np.sqrt(ss / n).astype(np.float32)
+
+            # the center of each group's samples
+
+            starts = (np.arange(i0, i1, group)) * bin_size
+
+            centers = starts + 0.5 * n[:, 0]
+
+        return dict(
+            time_axis = centers / self._sample_rate,
+            min = mn,
+            max = mx,
+            rms = rms,
+            level = level,
+        )
+
+
+    def plot(self, t0 = None, t1 = None, channel = 0, max_points = 2000, axes = None):
+        '''
+        Draws the min/max envelope and the rms of one channel.
+        '''
+
+        import matplotlib.pyplot as plt
+
+        data = self.query(t0, t1, max_points)
+
+        ax = axes
+
+        if ax is None:
+            ax = plt.gca()
+
+        t = data['time_axis']
+        mn = data['min'][:, channel]
+        mx = data['max'][:, channel]
+        rms = data['rms'][:, channel]
+
+        ax.fill_between(t, mn, mx, color = 'b', linewidth = 0)
+        ax.fill_between(t, -rms, rms, color = 'c', linewidth = 0)
+
+        return ax
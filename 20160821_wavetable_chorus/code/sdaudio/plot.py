@@ -0,0 +1,408 @@
+"""
+Plotting helpers
+
+imagesc() draws a matrix with linear axes labels.  For matrices much larger
+than the screen, like the spectrogram of a long recording, it can draw a
+downsampled copy instead: the visible part of the matrix is pooled (max or
+mean) down to about one cell per screen pixel of the axes, and pooled again
+whenever the axes are zoomed, panned or resized.  The matrix itself is never
+copied, so it can be a memory map.
+"""
+
+import collections
+
+import numpy as np
+
+
+from sdaudio import assert_py3
+
+
+DOWNSAMPLE_MODES = ['max', 'mean']
+
+# number of matrix cells pooled per chunk
+
+_CHUNK_CELLS = 2 ** 24
+
+
+def imagesc(x_axis, y_axis, Z, axes = None, downsample = None, **kwargs):
+    """
+    Plots the 2D matriz Z using the provided x & y axis for data labels.
+    Additional keyword argumnts will be passed on to the Matplotlib imshow()
+    method.
+
+    Parameters:
+        *x_axis*
+            The data labels to use for the x axis, must be linear (shape N)
+
+        *y_axis*
+            The data labels to use for the y axis, must be linear (shape M)
+
+        *Z*
+            The data matrix to plot (shape M,N)
+
+        *axes*
+            The matplotlib.axes.Axes to draw on
+
+        *downsample*
+            None to draw all of Z, or 'max' or 'mean' to draw the visible
+            part of Z pooled down to the pixel size of the axes, updated on
+            zoom, see Downsampler.  Z is then not copied.
+
+        `**kwargs`
+            Keyword arguments passed to matplotlib.axes.Axes.imshow()
+
+    Returns:
+
+        *h*
+            The graphical handle
+
+    Examples:
+
+        By default, the origin is in the lower left corner:
+
+        .. plot::
+            :include-source:
+
+            import numpy as np
+            import matplotlib.pyplot as plt
+
+            from sdaudio.plot import imagesc
+
+            # Create a data matrix, the Idenity with some zeros concatenated
+            data = np.eye(5)
+            data = np.hstack( (data, np.zeros((5,1))) )
+
+            x_axis = range(6)
+            y_axis = range(5)
+
+            plt.figure()
+            imagesc(x_axis, y_axis, data)
+            plt.xlabel("X axis")
+            plt.ylabel("Y axis")
+
+        To change it, pass the matplotlib.axes.Axes.imshow() keyword argument
+        `origin="upper"`:
+
+        .. plot::
+            :include-source:
+
+            import numpy as np
+            import matplotlib.pyplot as plt
+
+            from sdaudio.plot import imagesc
+
+            # Create a data matrix, the Idenity with some zeros concatenated
+            data = np.eye(5)
+            data = np.hstack( (data, np.zeros((5,1))) )
+
+            x_axis = range(6)
+            y_axis = range(5)
+
+            plt.figure()
+            imagesc(x_axis, y_axis, data, origin = "upper")
+            plt.xlabel("X axis")
+            plt.ylabel("Y axis")
+
+    """
+
+    import matplotlib.pyplot as plt
+
+    if downsample is not None and downsample not in DOWNSAMPLE_MODES:
+        raise ValueError(
+            "downsample must be None or one of %s, got %s" % (
+                DOWNSAMPLE_MODES, repr(downsample)))
+
+    # always make a copy so that caller doesn't get a linked colormap by
+    # accident!  Not needed when downsampling, the pooled copies are drawn.
+
+    if downsample is None:
+        Z = np.array(Z)
+
+    if Z.ndim != 2:
+        raise ValueError("Z should be 2D, not %dD" % Z.ndim)
+
+    M, N = Z.shape
+
+    if x_axis is None:
+        x_axis = np.arange(N).astype(np.int32)
+
+    if y_axis is None:
+        y_axis = np.arange(M).astype(np.int32)
+
+    # Convert to arrays if lists.
+    x_axis = np.array(x_axis)
+    y_axis = np.array(y_axis)
+
+    if M != y_axis.size:
+        raise ValueError("y_axis.size != Z rows (%d != %d)" %(y_axis.size, M))
+
+    if N != x_axis.size:
+        raise ValueError("x_axis.size != Z cols (%d != %d)" %(x_axis.size, N))
+
+    # Override these if not set.
+
+    kwargs.setdefault('origin', 'lower')
+    kwargs.setdefault('interpolation', 'nearest')
+
+    ax = axes
+
+    if ax is None:
+        ax = plt.gca()
+
+    if downsample is not None:
+
+        ds = Downsampler(ax, x_axis, y_axis, Z, downsample, kwargs['origin'])
+
+        image, extent = ds.pooled(*ds.visible(ax.get_xlim(), ax.get_ylim(), full = True))
+
+        kwargs["extent"] = extent
+
+        h = ax.imshow(image, **kwargs)
+
+        ax.axis("tight")
+
+        ds.connect(h)
+
+        return h
+
+    y_axis = y_axis[::-1]
+
+    if kwargs['origin'] == 'lower':
+        y_axis = y_axis[::-1]
+
+    dx = x_axis[1] - x_axis[0]
+    dy = y_axis[1] - y_axis[0]
+
+    extent = \
+    [
+        x_axis[0]  - 0.5 * dx,
+        x_axis[-1] + 0.5 * dx,
+        y_axis[0]  - 0.5 * dy,
+        y_axis[-1] + 0.5 * dy
+    ]
+
+    # Always override these keyword.
+    kwargs["extent"] = extent
+
+    h = ax.imshow(Z, **kwargs)
+
+    ax.axis("tight")
+
+    return h
+
+
+def pool(Z, fy, fx, mode = 'max'):
+    """
+    Returns Z reduced over blocks of fy rows by fx columns with the max or
+    the mean, the last blocks may be partial.  Z is read in chunks of
+    columns, it may be a memory map.
+    """
+
+    assert fy > 0 and fx > 0, "pool factors must be > 0"
+    assert mode in DOWNSAMPLE_MODES, "unknown mode %s" % repr(mode)
+
+    M, N = Z.shape
+
+    rows = np.arange(0, M, fy)
+    cols = np.arange(0, N, fx)
+
+    dtype = Z.dtype
+
+    if mode == 'mean':
+        dtype = np.result_type(Z.dtype, np.float32)
+
+    out = np.empty((len(rows), len(cols)), dtype)
+
+    # whole column blocks per chunk
+
+    chunk = max(1, _CHUNK_CELLS // max(1, M * fx)) * fx
+
+    for j0 in range(0, N, chunk):
+
+        j1 = min(j0 + chunk, N)
+
+        block = np.asarray(Z[:, j0 : j1])
+
+        c = cols[(cols >= j0) & (cols < j1)] - j0
+
+        if mode == 'max':
+            block = np.maximum.reduceat(block, c, axis = 1)
+            block = np.maximum.reduceat(block, rows, axis = 0)
+
+        else:
+            block = np.add.reduceat(block, c, axis = 1, dtype = dtype)
+            block = np.add.reduceat(block, rows, axis = 0)
+
+            n_rows = np.diff(np.append(rows, M))
+            n_cols = np.diff(np.append(c, j1 - j0))
+
+            block /= n_rows[:, np.newaxis] * n_cols[np.newaxis, :]
+
+        out[:, j0 // fx : j0 // fx + block.shape[1]] = block
+
+    return out
+
+
+class Downsampler(object):
+    '''
+    Keeps an imshow() image of a large matrix pooled to the pixel size of its
+    axes.  connect() redraws the visible part whenever the axes limits or
+    the figure size change.  The last few pooled images are cached, so
+    zooming back out does not pool again.
+    '''
+
+    def __init__(self, ax, x_axis, y_axis, Z, mode = 'max', origin = 'lower', cache_size = 8):
+
+        assert mode in DOWNSAMPLE_MODES, "unknown mode %s" % repr(mode)
+
+        self._ax = ax
+        self._Z = Z
+        self._mode = mode
+        self._origin = origin
+
+        # index to data coordinates, x = x0 + j * dx
+
+        self._x0 = float(x_axis[0])
+        self._y0 = float(y_axis[0])
+        self._dx = float(x_axis[1] - x_axis[0]) if len(x_axis) > 1 else 1.0
+        self._dy = float(y_axis[1] - y_axis[0]) if len(y_axis) > 1 else 1.0
+
+        self._image = None
+        self._key = None
+        self._cache = collections.OrderedDict()
+        self._cache_size = cache_size
+
+
+    def connect(self, image):
+        '''
+        Starts updating image on zoom, pan and resize.
+        '''
+
+        self._image = image
+
+        # the callback registries keep plain functions alive, which keep self
+
+        update = lambda *args : self.update()
+
+        self._ax.callbacks.connect('xlim_changed', update)
+        self._ax.callbacks.connect('ylim_changed', update)
+        self._ax.figure.canvas.mpl_connect('resize_event', update)
+
+
+    def visible(self, xlim, ylim, full = False):
+        '''
+        Returns (i0, i1, j0, j1, fy, fx): the rows [i0, i1) and columns
+        [j0, j1) of Z inside the limits, or all of Z if full, and the pool
+        factors that fit them into the axes' pixels.  The ranges are widened
+        to whole pool blocks, so panning reuses the same blocks.
+        '''
+
+        M, N = self._Z.shape
+
+        bbox = self._ax.get_window_extent()
+
+        width = max(1, int(bbox.width))
+        height = max(1, int(bbox.height))
+
+        if full:
+            i0, i1, j0, j1 = 0, M, 0, N
+
+        else:
+            j0, j1 = self._index_range(xlim, self._x0, self._dx, N)
+            i0, i1 = self._index_range(ylim, self._y0, self._dy, M)
+
+        fx = max(1, -(-(j1 - j0) // width))
+        fy = max(1, -(-(i1 - i0) // height))
+
+        j0 = (j0 // fx) * fx
+        i0 = (i0 // fy) * fy
+
+        j1 = min(N, -(-j1 // fx) * fx)
+        i1 = min(M, -(-i1 // fy) * fy)
+
+        return i0, i1, j0, j1, fy, fx
+
+
+    def pooled(self, i0, i1, j0, j1, fy, fx):
+        '''
+        Returns (image, extent) of the pooled block, from the cache if
+        possible.
+        '''
+
+        key = (i0, i1, j0, j1, fy, fx)
+
+        image = self._cache.pop(key, None)
+
+        if image is None:
+            image = pool(self._Z[i0 : i1, j0 : j1], fy, fx, self._mode)
+
+        self._cache[key] = image
+
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last = False)
+
+        # the block's edges, like imagesc() computes them for all of Z
+
+        x_lo = self._x0 + (j0 - 0.5) * self._dx
+        x_hi = self._x0 + (j1 - 0.5) * self._dx
+
+        y_lo = self._y0 + (i0 - 0.5) * self._dy
+        y_hi = self._y0 + (i1 - 0.5) * self._dy
+
+        if self._origin == 'lower':
+            extent = [x_lo, x_hi, y_lo, y_hi]
+
+        else:
+            extent = [x_lo, x_hi, y_hi, y_lo]
+
+        return image, extent
+
+
+    def update(self):
+        '''
+        Redraws the image for the current axes limits and size.
+        '''
+
+        if self._image is None:
+            return
+
+        ax = self._ax
+
+        xlim = ax.get_xlim()
+        ylim = ax.get_ylim()
+
+        key = self.visible(xlim, ylim)
+
+        if key == self._key:
+            return
+
+        self._key = key
+
+        image, extent = self.pooled(*key)
+
+        self._image.set_data(image)
+        self._image.set_extent(extent)
+
+        # set_extent() may autoscale the limits to the block, keep the view
+
+        ax.set_xlim(xlim, emit = False, auto = None)
+        ax.set_ylim(ylim, emit = False, auto = None)
+
+        ax.figure.canvas.draw_idle()
+
+
+    def _index_range(self, lim, v0, dv, n):
+        '''
+        Returns the [begin, end) indices of the cells inside the limits.
+        '''
+
+        a = (lim[0] - v0) / dv + 0.5
+        b = (lim[1] - v0) / dv + 0.5
+
+        lo = int(np.floor(min(a, b)))
+        hi = int(np.ceil(max(a, b)))
+
+        lo = min(max(lo, 0), n - 1)
+        hi = min(max(hi, lo + 1), n)
+
+        return lo, hi
@@ -0,0 +1,214 @@
+"""
+Sliding DFT
+
+Computes selected bins of the dft of frames that start every `step` samples
+without an fft per frame.  With theta = 2 pi u / n, the unwindowed bin u of
+the n point frame starting at sample s obeys the recursion:
+
+    Y[u](s + 1) = (Y[u](s) + x[s + n] - x[s]) * exp(1j * theta)
+
+so each new sample updates each bin once.  Over one hop of `step` samples:
+
+    Y[u](s + step) = r * Y[u](s) + V[u](s)
+
+    r = exp(1j * theta * step)
+
+    V[u](s) = sum_{t < step} (x[s + n + t] - x[s + t]) * exp(1j * theta * (step - t))
+
+The V of all hops are one matrix product, and the recursion over hops is a
+cumulative sum of V * r ** -g, rotated back by r ** g.  The first frame of
+every `resync` frames is computed directly, which restarts the recursion so
+rounding errors do not accumulate over long signals.
+
+Cosine sum windows (rectangular, hann, hamming, blackman-harris) are applied
+after the transform as a weighted sum of neighbouring bins:
+
+    w[i] = sum_j b[j] * cos(2 * pi * j * i / n)
+
+    X[k] = b[0] * Y[k] + sum_{j > 0} b[j] / 2 * (Y[k - j] + Y[k + j])
+"""
+
+import numpy as np
+
+
+from sdaudio import assert_py3
+
+
+class SlidingDft(object):
+    '''
+    Sliding dft of n point frames every step samples for the given bins.
+
+    coeffs are the cosine sum coefficients b[j] of the window, see above.
+    '''
+
+    def __init__(self, n, step, bins, coeffs, resync = 256, dtype = np.complex64):
+
+        bins = np.asarray(bins, np.int64)
+
+        assert n > 0, "n <= 0"
+        assert step > 0, "step <= 0"
+        assert resync > 0, "resync <= 0"
+        assert bins.ndim == 1 and len(bins) > 0, "bins must be a non empty 1D sequence"
+        assert np.all((bins >= 0) & (bins <= n // 2)), "bins out of range"
+
+        #---------------------------------------------------------------------
+        # the unwindowed bins the window terms need, and for every window
+        # term j > 0 where bins k - j and k + j are in that list
+
+        needed = np.unique(np.concatenate([
+            (bins + sign * j) % n
+            for j in range(len(coeffs))
+            for sign in [-1, 1]
+        ]))
+
+        terms = []
+
+        for j, b in enumerate(coeffs):
+
+            lo = np.searchsorted(needed, (bins - j) % n)
+            hi = np.searchsorted(needed, (bins + j) % n)
+
+            if j == 0:
+                terms.append((b, lo, None))
+
+            else:
+                terms.append((0.5 * b, lo, hi))
+
+        self._n = n
+        self._step = step
+        self._resync = resync
+        self._dtype = dtype
+        self._needed = needed
+        self._terms = terms
+
+        # phase tables, exp(-2j pi i / n) is indexed with (u * i) % n to keep
+        # the phases exact
+
+        twiddle = np.exp(-2j * np.pi * np.arange(n) / n)
+
+        u = needed[np.newaxis, :]
+
+        # the dft of the first frame of a segment, shape (n, n_needed)
+
+        self._first = twiddle[(np.arange(n)[:, np.newaxis] * u) % n]
+
+        # the hop update, exp(1j theta (step - t)), shape (step, n_needed)
+
+        hop = np.conj(twiddle[((step - np.arange(step))[:, np.newaxis] * u) % n])
+
+        self._hop_re = np.ascontiguousarray(hop.real)
+        self._hop_im = np.ascontiguousarray(hop.imag)
+
+        # r ** g for the frames of a segment, shape (resync, n_needed)
+
+        self._rotate = np.conj(twiddle[((np.arange(resync) * step)[:, np.newaxis] * u) % n])
+
+
+    @property
+    def n_needed(self):
+        '''
+        The number of unwindowed bins computed per frame.
+        '''
+        return len(self._needed)
+
+
+    def __call__(self, x, n_frames):
+        '''
+        Transforms the n_frames frames of x (..., n_samples), the first frame
+        starts at x[..., 0].  Returns (..., n_frames, n_bins).
+        '''
+
+        n, step = self._n, self._step
+
+        assert x.shape[-1] >= (n_frames - 1) * step + n, "x is too short"
+
+        n_bins = len(self._terms[0][1])
+
+        out = np.zeros(x.shape[:-1] + (n_frames, n_bins), self._dtype)
+
+        for f0 in range(0, n_frames, self._resync):
+
+            f1 = min(f0 + self._resync, n_frames)
+
+            Y = self._unwindowed(x[..., f0 * step : (f1 - 1) * step + n], f1 - f0)
+
+            self._apply_window(Y, out[..., f0 : f1, :])
+
+        return out
+
+
+    def _unwindowed(self, x, n_frames):
+        '''
+        Returns the unwindowed bins (..., n_frames, n_needed) of the frames of
+        x, starting with a direct dft of the frame at x[..., 0].
+        '''
+
+        n, step = self._n, self._step
+
+        x = x.astype(np.float64)
+
+        Y = np.empty(x.shape[:-1] + (n_frames, len(self._needed)), np.complex128)
+
+        Y[..., 0, :] = np.matmul(x[..., : n], self._first)
+
+        if n_frames == 1:
+            return Y
+
+        # the samples entering and leaving each frame, one hop per row
+
+        shape = x.shape[:-1] + (n_frames - 1, step)
+
+        D = x[..., n : n + (n_frames - 1) * step].reshape(shape)
+        D = D - x[..., : (n_frames - 1) * step].reshape(shape)
+
+        V = Y[..., 1 :, :]
+
+        V.real = np.matmul(D, self._hop_re)
+        V.imag = np.matmul(D, self._hop_im)
+
+        # Y[g] = r ** g * (Y[0] + sum_{1 <= i <= g} V[i] * r ** -i)
+
+        rotate = self._rotate[1 : n_frames]
+
+        V *= np.conj(rotate)
+
+        np.cumsum(V, axis = -2, out = V)
+
+        V += Y[..., 0 : 1, :]
+
+        V *= rotate
+
+        return Y
+
+
+    def _apply_window(self, Y, out):
+
+        for b, lo, hi in self._terms:
+
+            if hi is None:
+                out += b * Y[..., lo]
+
+            else:
+                out += b * (Y[..., lo] + Y[..., hi])
+
+
+def cosine_coeffs(window, n):
+    """
+    Returns the cosine sum coefficients b[j] of a periodic window of length n
+    normalized to sum to 1, from the a0 - a1 cos + a2 cos - ... form.
+    """
+
+    window = np.asarray(window, np.float64)
+
+    signs = (-1.0) ** np.arange(len(window))
+
+    return signs * window / (n * window[0])
+
+
+def frame_cost(n, step, n_needed):
+    """
+    Rough operation counts per frame, returns (sdft, fft).  The sliding dft
+    costs the hop update of n_needed bins plus the rotations, cumulative sum
+    and window, weighted for numpy's per element overhead.
+    """
+    return n_needed * (4.0 * step + 120.0), 2.5 * n * np.log2(n)
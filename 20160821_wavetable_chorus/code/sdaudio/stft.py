@@ -0,0 +1,1879 @@
+"""
+Short time Fourier transform
+"""
+
+import collections
+import os
+import tempfile
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+from sdaudio import assert_py3
+from sdaudio import czt
+from sdaudio import decimate
+from sdaudio import fft_backend
+from sdaudio import filterbank
+from sdaudio import sdft
+from sdaudio import wavio
+
+
+class Stft(object):
+
+    @staticmethod
+    def get_defaults():
+
+        return dict(
+            sample_rate = 8000.0,
+            t_sigma = 0.01,
+            t_step = 0.01,
+            f_step = 16.666,
+            window = 'gaussian',
+            kaiser_beta = 8.6,
+            n_workers = 1,
+            executor = 'thread',
+            fft_backend = 'auto',
+            fft_workers = 1,
+            precision = 'single',
+            fft_size_policy = 'smooth',
+            output = 'complex',
+            output_exponent = 0.33,
+            filterbank = None,
+            n_bands = 64,
+            fmin = 0.0,
+            fmax = None,
+            zoom_bins = None,
+            sdft = False,
+            sdft_bins = None,
+            sdft_resync = 256,
+            decimate = None,
+        )
+
+
+    def __init__(self, **kwargs):
+        """
+        Computes the short time fourier transform on input signal.
+
+        keyword arguments:
+
+            sample_rate : float
+                The sample rate of the input signal.
+
+            t_sigma : float
+                The standard deviation of the gaussian time-envelope used for
+                the window.
+
+            t_step : float
+                The time step in seconds between fft samples
+
+            f_step : float
+                The frequency axis step size (nfft & frame_size are derived from this)
+
+            window : str
+                The name of the window to apply to the frame, one of: [
+                    'gaussian', 'rectangular', 'hann', 'hamming',
+                    'blackmanharris', 'kaiser']
+
+            kaiser_beta : float
+                The shape parameter of the kaiser window (optional)
+
+            n_workers : int
+                The number of workers __call__() splits the frames across,
+                None uses one per cpu core (optional)
+
+            executor : str
+                How the workers run, one of: ['thread', 'process'] (optional)
+
+            fft_backend : str
+                The fft implementation, one of: ['auto', 'numpy', 'scipy'],
+                see sdaudio.fft_backend (optional)
+
+            fft_workers : int
+                The number of threads scipy.fft uses per batched call
+                (optional)
+
+            precision : str
+                'single' computes with float32 frames into a complex64
+                spectrum, 'double' with float64 frames into complex128
+                (optional)
+
+            fft_size_policy : str
+                How the frame size is rounded up, 'smooth' picks the smallest
+                even 2, 3, 5 smooth size, 'pow2' the next power of 2
+                (optional)
+
+            output : str
+                What stft_spec holds, one of: [
+                    'complex', 'magnitude', 'power', 'db', 'compressed']
+                all but 'complex' are real valued and are reduced chunk by
+                chunk right after the fft (optional)
+
+            output_exponent : float
+                The exponent of the 'compressed' output, abs(X) ** exponent
+                (optional)
+
+            filterbank : str
+                None, 'mel' or 'log', projects each chunk of frames onto
+                n_bands triangular bands before the output reduction, so
+                stft_spec has shape (..., n_time, n_bands) and the full
+                resolution spectrum is never stored.  'magnitude' and
+                'compressed' project abs(X), 'power' and 'db' project
+                abs(X) ** 2.  Requires a real valued output (optional)
+
+            n_bands, fmin, fmax : int, float, float
+                The number of bands and their frequency range, fmax None is
+                the nyquist frequency, see sdaudio.filterbank (optional)
+
+            zoom_bins : int
+                None or the number of bins evenly spaced over [fmin, fmax]
+                that are computed with a chirp-z transform instead of the
+                full band rfft, see sdaudio.czt.  Narrow bands can then be
+                resolved finer than f_step at the cost of an fft of about
+                nfft + zoom_bins points.  Bins spaced at least as far apart
+                as the rfft's are taken from the rfft instead, the nearest
+                rfft bin to each, and the frequency axis holds those bins'
+                frequencies.  Not combined with a filterbank (optional)
+
+            sdft : bool
+                Computes the frames with a sliding dft, see sdaudio.sdft,
+                which updates each bin once per new sample instead of an fft
+                per frame.  Only used with the rectangular and cosine
+                windows and while the hop is small enough to be cheaper than
+                the fft, otherwise the fft is used (optional)
+
+            sdft_bins : sequence of int
+                None or the rfft bin indices to compute, stft_spec then holds
+                only these bins, with or without the sliding dft.  Not
+                combined with a filterbank or zoom_bins (optional)
+
+            sdft_resync : int
+                The number of frames after which the sliding dft restarts its
+                running sums (optional)
+
+            decimate : int or str
+                None, an integer factor q or 'auto'.  The input is low-pass
+                filtered and decimated by q before framing, see
+                sdaudio.decimate, and the frames, window and axes are set up
+                for sample_rate / q, so all fft work drops by about q.
+                An integer q must divide the step of
+                round(sample_rate * t_step) samples.  Bins above 0.8 times
+                the new nyquist frequency are in the filter's transition
+                band.  The filter costs about 50 multiply-adds per input
+                sample, so it pays off with small steps or long frames,
+                where the fft work dominates.  'auto' picks the cheapest q,
+                see sdaudio.decimate.frame_cost(), among those that keep
+                fmax in the filter's passband and divide the step, 1 when
+                no decimation pays off (optional)
+
+        The window and axes are shared between instances with the same
+        configuration, see also get_stft().
+        """
+
+        defaults = Stft.get_defaults()
+
+        sr = kwargs['sample_rate']
+        t_sigma = kwargs['t_sigma']
+        t_step  = kwargs['t_step']
+        f_step  = kwargs['f_step']
+        window  = kwargs['window']
+
+        kaiser_beta = kwargs.get('kaiser_beta', defaults['kaiser_beta'])
+        n_workers = kwargs.get('n_workers', defaults['n_workers'])
+        executor = kwargs.get('executor', defaults['executor'])
+        backend = kwargs.get('fft_backend', defaults['fft_backend'])
+        fft_workers = kwargs.get('fft_workers', defaults['fft_workers'])
+        precision = kwargs.get('precision', defaults['precision'])
+        policy = kwargs.get('fft_size_policy', defaults['fft_size_policy'])
+        output = kwargs.get('output', defaults['output'])
+        output_exponent = kwargs.get('output_exponent', defaults['output_exponent'])
+        fb_kind = kwargs.get('filterbank', defaults['filterbank'])
+        n_bands = kwargs.get('n_bands', defaults['n_bands'])
+        fmin = kwargs.get('fmin', defaults['fmin'])
+        fmax = kwargs.get('fmax', defaults['fmax'])
+        zoom_bins = kwargs.get('zoom_bins', defaults['zoom_bins'])
+        use_sdft = kwargs.get('sdft', defaults['sdft'])
+        sdft_bins = kwargs.get('sdft_bins', defaults['sdft_bins'])
+        sdft_resync = kwargs.get('sdft_resync', defaults['sdft_resync'])
+        q = kwargs.get('decimate', defaults['decimate'])
+
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+
+        assert sr > 0, "sample_rate <= 0"
+        assert t_sigma > 0, "t_sigma <= 0"
+        assert t_step > 0, "t_step <= 0"
+        assert f_step > 0, "f_step <= 0"
+        assert n_workers > 0, "n_workers <= 0"
+        assert executor in ['thread', 'process'], "executor must be 'thread' or 'process'"
+        assert precision in PRECISIONS, "precision must be 'single' or 'double'"
+        assert policy in FFT_SIZE_POLICIES, "fft_size_policy must be 'smooth' or 'pow2'"
+        assert output in OUTPUTS, "output must be one of %s" % OUTPUTS
+        assert output_exponent > 0, "output_exponent <= 0"
+        assert fb_kind is None or output != 'complex', "filterbank requires a real valued output"
+        assert fb_kind is None or zoom_bins is None, "filterbank and zoom_bins can not be combined"
+        assert zoom_bins is None or zoom_bins > 0, "zoom_bins <= 0"
+        assert sdft_bins is None or fb_kind is None, "sdft_bins and filterbank can not be combined"
+        assert sdft_bins is None or zoom_bins is None, "sdft_bins and zoom_bins can not be combined"
+        assert not use_sdft or zoom_bins is None, "sdft and zoom_bins can not be combined"
+
+        #---------------------------------------------------------------------
+        # decimation, the frames are set up at the decimated rate
+
+        if q == 'auto':
+            assert fmax is not None, "decimate = 'auto' requires fmax"
+
+            hop = int(np.round(sr * t_step))
+
+            # the largest factor is not always the cheapest, with large
+            # hops the filter costs more than the smaller ffts save
+
+            costs = {}
+
+            for k in range(1, decimate.choose_factor(sr, fmax, hop) + 1):
+
+                if hop % k == 0:
+                    nfft_k = _setup(sr / float(k), t_sigma, t_step, f_step, window, kaiser_beta, policy)[1]
+                    costs[k] = decimate.frame_cost(k, hop, nfft_k)
+
+            q = min(costs, key = costs.get)
+
+        elif q is None:
+            q = 1
+
+        assert int(q) == q and q >= 1, "decimate must be None, 'auto' or an integer >= 1"
+
+        q = int(q)
+
+        # the frames must stay on the full rate transform's hop
+
+        assert int(np.round(sr * t_step)) % q == 0, (
+            "decimate %d does not divide the step of %d samples" % (q, int(np.round(sr * t_step))))
+
+        frame_rate = sr / float(q)
+
+        setup = _setup(frame_rate, t_sigma, t_step, f_step, window, kaiser_beta, policy)
+
+        step, nfft, freq_axis, w = setup
+
+        #---------------------------------------------------------------------
+        # save values into object
+
+        self._config = dict(kwargs)
+        self._freq_axis = freq_axis
+        self._nfft = nfft
+        self._sample_rate = sr
+        self._decimate = q
+        self._frame_rate = frame_rate
+        self._step = step
+        self._window = w
+        self._n_workers = n_workers
+        self._executor = executor
+
+        self._fft = fft_backend.get_backend(backend, fft_workers)
+        self._real_dtype, self._complex_dtype = PRECISIONS[precision]
+        self._fft_dtype = fft_backend.result_dtype(self._fft, self._real_dtype)
+
+        self._output = output
+        self._output_exponent = output_exponent
+        self._out_dtype = self._complex_dtype
+
+        if output != 'complex':
+            self._out_dtype = self._real_dtype
+
+        self._filterbank = None
+        self._out_freq_axis = freq_axis
+
+        if fb_kind is not None:
+            self._filterbank = filterbank.get_filterbank(
+                fb_kind, frame_rate, nfft, n_bands, fmin, fmax)
+            self._out_freq_axis = self._filterbank.center_freqs
+
+        self._zoom = None
+        self._bins = None
+
+        if zoom_bins is not None:
+
+            if fmax is None:
+                fmax = frame_rate / 2.0
+
+            assert 0.0 <= fmin <= fmax <= frame_rate / 2.0, "need 0 <= fmin <= fmax <= nyquist"
+
+            bin_hz = frame_rate / float(nfft)
+
+            zoom_hz = bin_hz
+
+            if zoom_bins > 1:
+                zoom_hz = (fmax - fmin) / float(zoom_bins - 1)
+
+            # no finer than the rfft's bins, the nearest rfft bins are
+            # cheaper than a chirp-z of nfft + zoom_bins points
+
+            if zoom_hz >= bin_hz:
+
+                grid = fmin + zoom_hz * np.arange(zoom_bins)
+
+                self._bins = np.round(grid / bin_hz).astype(np.int64)
+                self._bins = np.minimum(self._bins, len(freq_axis) - 1)
+                self._bins.setflags(write = False)
+
+                self._out_freq_axis = freq_axis[self._bins]
+
+        if zoom_bins is not None and self._bins is None:
+
+            self._zoom = czt.ChirpZ(
+                nfft,
+                zoom_bins,
+                fmin,
+                fmax,
+                frame_rate,
+                fft_size = round_up_smooth(nfft + zoom_bins - 1),
+                dtype = self._complex_dtype,
+                backend = self._fft,
+            )
+
+            self._out_freq_axis = self._zoom.freq_axis
+
+        self._sdft = None
+
+        if sdft_bins is not None:
+
+            self._bins = np.array(sdft_bins, np.int64)
+
+            assert self._bins.ndim == 1, "sdft_bins must be 1D"
+            assert np.all((self._bins >= 0) & (self._bins < len(freq_axis))), "sdft_bins out of range"
+
+            self._bins.setflags(write = False)
+
+            self._out_freq_axis = freq_axis[self._bins]
+
+        if use_sdft and window in SDFT_WINDOWS:
+
+            bins = self._bins
+
+            if bins is None:
+                bins = np.arange(len(freq_axis))
+
+            op = sdft.SlidingDft(
+                nfft,
+                step,
+                bins,
+                sdft.cosine_coeffs(SDFT_WINDOWS[window], nfft),
+                sdft_resync,
+                self._complex_dtype,
+            )
+
+            # falls back to the fft for large hops
+
+            sdft_cost, fft_cost = sdft.frame_cost(nfft, step, op.n_needed)
+
+            if sdft_cost < fft_cost:
+                self._sdft = op
+
+        # per thread scratch buffers, see _scratch()
+
+        self._local = threading.local()
+
+
+    def __call__(self, **kwargs):
+        """
+        inputs: signal, sample_rate, out_path (optional)
+        outputs: stft_spec, stft_freq_axis, stft_time_axis
+
+        signal is either 1D or 2D with shape (n_samples, n_channels), for 2D
+        input stft_spec has shape (n_channels, n_time, n_freq) and all
+        channels share the framing and window and are transformed together.
+
+        If out_path is given the frames are written chunk by chunk into a
+        memory mapped .npy file at out_path instead of an array in memory,
+        the axes are saved next to it, see save_axes(), and stft_spec is the
+        file opened read only with np.load(mmap_mode = 'r').  Without
+        out_path the 'process' executor returns stft_spec as the writable
+        memory map of an unlinked temporary file, see _transform_processes().
+        """
+
+        signal = kwargs['signal']
+        sample_rate = kwargs['sample_rate']
+        out_path = kwargs.get('out_path', None)
+
+        assert int(self._sample_rate) == int(sample_rate), "sample_rate != %d" % self._sample_rate
+        assert signal.ndim in [1, 2], "signal must be 1D or 2D"
+
+        # channels first, so each channel's samples are along the last axis
+
+        channels = signal.T
+
+        if signal.ndim == 1:
+            channels = signal[np.newaxis, :]
+
+        channels = self._decimated(channels)
+
+        # compute slices of the input signal
+
+        sample_slices = compute_sample_slices(
+            channels.shape[1],
+            self._nfft,
+            self._step
+        )
+
+        #---------------------------------------------------------------------
+        # forward stft, in chunks of frames to bound the temporary memory
+
+        n_time = len(sample_slices)
+
+        time_axis = sample_slices['center']
+
+        n_channels = channels.shape[0]
+
+        shape = (n_channels, n_time, len(self._out_freq_axis))
+
+        ranges = _split_range(n_time, self._n_workers, self._chunk_frames(n_channels))
+
+        if len(ranges) == 1:
+
+            spec = self._alloc_spec(shape, signal.ndim, out_path)
+
+            self._transform_range(channels, spec, 0, n_time)
+
+        elif self._executor == 'thread':
+
+            spec = self._alloc_spec(shape, signal.ndim, out_path)
+
+            with ThreadPoolExecutor(len(ranges)) as pool:
+
+                jobs = [
+                    pool.submit(self._transform_range, channels, spec, f0, f1)
+                    for f0, f1 in ranges
+                ]
+
+                for job in jobs:
+                    job.result()
+
+        elif out_path is not None:
+
+            # the workers open the file themselves
+
+            spec = self._alloc_spec(shape, signal.ndim, out_path)
+
+            self._transform_processes(channels, shape, ranges, out_path)
+
+        else:
+            spec = self._transform_processes(channels, shape, ranges)
+
+        #---------------------------------------------------------------------
+        # conver time axis into seconds
+
+        time_axis = time_axis.astype(np.float32) / self._frame_rate
+
+        if out_path is not None:
+
+            spec.flush()
+
+            del spec
+
+            save_axes(out_path, self._out_freq_axis, time_axis, self._sample_rate)
+
+            spec = np.load(out_path, mmap_mode = 'r')
+
+        elif signal.ndim == 1:
+            spec = spec[0]
+
+        out = dict(
+            stft_spec = spec,
+            stft_freq_axis = np.array(self._out_freq_axis),
+            stft_time_axis = time_axis,
+        )
+
+        out.update(self._fft_info('stft'))
+
+        kwargs.update(out)
+
+        return kwargs
+
+
+    def batch(self, **kwargs):
+        """
+        inputs: signals, sample_rate
+        outputs: stft_spec, stft_offsets, stft_specs, stft_freq_axis,
+                 stft_time_axis
+
+        Transforms a list of 1D signals of any lengths in one pass.  The clips
+        are packed into one zero padded buffer, each clip's frames followed by
+        enough zeros that frames never straddle two clips, so every frame of
+        every clip lies on one evenly strided frame grid and is transformed by
+        the same batched fft calls.  The few grid frames between clips are
+        dropped.
+
+            stft_spec : all clips' frames, shape (n_frames, n_freq)
+            stft_offsets : clip i is stft_spec[offsets[i] : offsets[i + 1]]
+            stft_specs : the list of per clip views into stft_spec
+            stft_time_axis : each frame's time within its clip (n_frames)
+
+        Each clip's frames are identical to calling the Stft on that clip.
+        With n_workers > 1 the grid is split across threads.
+        """
+
+        signals = kwargs['signals']
+        sample_rate = kwargs['sample_rate']
+
+        assert int(self._sample_rate) == int(sample_rate), "sample_rate != %d" % self._sample_rate
+        assert len(signals) > 0, "no signals"
+        assert all(x.ndim == 1 for x in signals), "signals must be 1D"
+
+        step = self._step
+        h_frame = self._nfft // 2
+
+        if self._decimate > 1:
+            signals = [self._decimated(x) for x in signals]
+
+        lengths = np.array([len(x) for x in signals], np.int64)
+
+        assert np.all(lengths > 0), "empty signal"
+
+        #---------------------------------------------------------------------
+        # layout, clip i owns grid frames [g[i], g[i] + n[i] + gap)
+
+        n = _n_frames(lengths, self._nfft, step)
+
+        gap = (self._nfft - 1) // step
+
+        g = np.zeros(len(n) + 1, np.int64)
+        np.cumsum(n + gap, out = g[1 :])
+
+        n_grid = int(g[-1])
+
+        offsets = np.zeros(len(n) + 1, np.int64)
+        np.cumsum(n, out = offsets[1 :])
+
+        n_total = int(offsets[-1])
+
+        # frame index within its clip, and which grid frames are real frames
+
+        frame = np.arange(n_total) - np.repeat(offsets[: -1], n)
+
+        valid = np.zeros(n_grid, bool)
+        valid[np.repeat(g[: -1], n) + frame] = True
+
+        #---------------------------------------------------------------------
+        # pack the clips, sample j of clip i goes to g[i] * step + h + j, the
+        # last sample of each clip is never used.  One slice copy per clip is
+        # cheaper than scattering with per sample indices.
+
+        dtype = np.result_type(np.float32, *set(x.dtype for x in signals))
+
+        buf = np.zeros((1, (n_grid - 1) * step + self._nfft), dtype)
+
+        starts = g[: -1] * step + h_frame
+
+        for x, p0 in zip(signals, starts.tolist()):
+            buf[0, p0 : p0 + len(x) - 1] = x[: -1]
+
+        #---------------------------------------------------------------------
+        # transform the grid
+
+        spec = np.zeros((1, n_total, len(self._out_freq_axis)), self._out_dtype)
+
+        # output row of the first real frame at or after each grid frame
+
+        out_row = np.concatenate([[0], np.cumsum(valid)])
+
+        ranges = _split_range(n_grid, self._n_workers, self._chunk_frames())
+
+        if len(ranges) == 1:
+            self._transform_grid(buf, valid, out_row, spec, 0, n_grid)
+
+        else:
+
+            with ThreadPoolExecutor(len(ranges)) as pool:
+
+                jobs = [
+                    pool.submit(self._transform_grid, buf, valid, out_row, spec, g0, g1)
+                    for g0, g1 in ranges
+                ]
+
+                for job in jobs:
+                    job.result()
+
+        spec = spec[0]
+
+        out = dict(
+            stft_spec = spec,
+            stft_offsets = offsets,
+            stft_specs = [spec[o0 : o1] for o0, o1 in zip(offsets[: -1], offsets[1 :])],
+            stft_freq_axis = np.array(self._out_freq_axis),
+            stft_time_axis = (frame * step).astype(np.float32) / self._frame_rate,
+        )
+
+        out.update(self._fft_info('stft'))
+
+        kwargs.update(out)
+
+        return kwargs
+
+
+    def n_frames(self, n_samples):
+        """
+        Returns the number of frames of a signal of n_samples samples.
+        """
+        return _n_frames(-(-n_samples // self._decimate), self._nfft, self._step)
+
+
+    def _decimated(self, x):
+        """
+        Returns x decimated along the last axis if decimate is on.
+        """
+
+        if self._decimate == 1:
+            return x
+
+        return decimate.Decimator(self._decimate, dtype = self._real_dtype).decimate(x)
+
+
+    def _transform_grid(self, buf, valid, out_row, spec, g0, g1):
+        """
+        Computes the frames [g0, g1) of the batch() frame grid, the real
+        frames among them are written to their rows of spec.
+        """
+
+        chunk = self._chunk_frames()
+
+        for c0 in range(g0, g1, chunk):
+
+            c1 = min(c0 + chunk, g1)
+
+            X = self._rfft_frames(buf, c0 * self._step, c1 - c0)
+
+            self._reduce(X[:, valid[c0 : c1]], spec[:, out_row[c0] : out_row[c1]])
+
+
+    def _transform_range(self, channels, spec, f0, f1):
+        """
+        Computes frames [f0, f1) of channels (shape n_channels, n_samples)
+        into spec[:, f0 : f1], in chunks of frames to bound the temporary
+        memory.
+        """
+
+        chunk = self._chunk_frames(channels.shape[0])
+
+        for c0 in range(f0, f1, chunk):
+
+            c1 = min(c0 + chunk, f1)
+
+            buf, buf_start = self._pad_frames(channels, c0, c1)
+
+            X = self._rfft_frames(buf, c0 * self._step - buf_start, c1 - c0)
+
+            self._reduce(X, spec[:, c0 : c1])
+
+
+    def _transform_processes(self, channels, shape, ranges, out_path = None):
+        """
+        Computes all frames on a process pool.  The signal lives in shared
+        memory, each worker writes its frame range directly into the .npy
+        file at out_path.  Without out_path the workers write into a
+        temporary file, in /dev/shm where there is one, that is unlinked
+        once mapped, and its writable memory map is returned, so the
+        spectrum is never copied.
+        """
+
+        src = np.ascontiguousarray(channels)
+
+        tmp_path = None
+
+        if out_path is None:
+
+            tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+            fd, tmp_path = tempfile.mkstemp(suffix = '.npy', dir = tmp_dir)
+            os.close(fd)
+
+            out_path = tmp_path
+
+            np.lib.format.open_memmap(
+                out_path, mode = 'w+', dtype = self._out_dtype, shape = shape).flush()
+
+        shm_in = shared_memory.SharedMemory(create = True, size = max(src.nbytes, 1))
+
+        spec = None
+
+        try:
+
+            np.ndarray(src.shape, src.dtype, shm_in.buf)[...] = src
+
+            config = dict(self._config, n_workers = 1)
+
+            jobs = [
+                (config, shm_in.name, src.shape, src.dtype.str, out_path, shape, f0, f1)
+                for f0, f1 in ranges
+            ]
+
+            with ProcessPoolExecutor(len(ranges)) as pool:
+                list(pool.map(_process_worker, jobs))
+
+            # the mapping outlives the unlinked file
+
+            if tmp_path is not None:
+                spec = np.load(tmp_path, mmap_mode = 'r+')
+
+        finally:
+            shm_in.close()
+            shm_in.unlink()
+
+            if tmp_path is not None:
+                os.remove(tmp_path)
+
+        return spec
+
+
+    def _alloc_spec(self, shape, ndim, out_path = None):
+        """
+        Returns a zeroed spectrum of shape (n_channels, n_time, n_freq), in
+        memory or as a writable memory map of a new .npy file at out_path.
+        The file holds shape[1:] for 1D signals.
+        """
+
+        if out_path is None:
+            return np.zeros(shape, self._out_dtype)
+
+        file_shape = shape
+
+        if ndim == 1:
+            file_shape = shape[1:]
+
+        spec = np.lib.format.open_memmap(
+            out_path, mode = 'w+', dtype = self._out_dtype, shape = file_shape)
+
+        return spec.reshape(shape)
+
+
+    def stream(self, blocks):
+        """
+        Generator that computes the stft over an iterable of 1D signal blocks.
+
+        The blocks are treated as one continuous signal, see StreamingStft.
+
+        Yields dicts with the frames completed by each block:
+
+            stft_spec, stft_freq_axis, stft_time_axis
+
+        The concatenation of all yielded frames is identical to calling the
+        Stft on the concatenation of all blocks.
+        """
+
+        streaming = StreamingStft(**self._config)
+
+        for block in blocks:
+
+            data = streaming.push(block)
+
+            if len(data['stft_time_axis']) > 0:
+                yield data
+
+        data = streaming.flush()
+
+        if len(data['stft_time_axis']) > 0:
+            yield data
+
+
+    def _transform_padded(self, buf, buf_start, i_frame, n_frames):
+        """
+        Transforms n_frames frames starting with frame index i_frame from the
+        padded signal held in buf, which starts at padded index buf_start.
+        buf is 1D or channels first 2D.
+        """
+
+        shape = buf.shape[:-1] + (n_frames, len(self._out_freq_axis))
+
+        spec = np.zeros(shape, self._out_dtype)
+
+        chunk = self._chunk_frames(int(np.prod(buf.shape[:-1])))
+
+        for f0 in range(0, n_frames, chunk):
+
+            f1 = min(f0 + chunk, n_frames)
+
+            offset = (i_frame + f0) * self._step - buf_start
+
+            X = self._rfft_frames(buf, offset, f1 - f0)
+
+            self._reduce(X, spec[..., f0 : f1, :])
+
+        centers = np.arange(i_frame, i_frame + n_frames) * self._step
+
+        out = dict(
+            stft_spec = spec,
+            stft_freq_axis = np.array(self._out_freq_axis),
+            stft_time_axis = centers.astype(np.float32) / self._frame_rate,
+        )
+
+        out.update(self._fft_info('stft'))
+
+        return out
+
+
+    def _fft_info(self, prefix):
+        """
+        Result metadata: the fft backend used and the dtype it computed in.
+        """
+
+        return {
+            prefix + '_fft_backend' : self._fft.name,
+            prefix + '_fft_dtype' : str(self._fft_dtype),
+        }
+
+
+    def _chunk_frames(self, n_channels = 1):
+        """
+        Number of frames transformed per batched fft call.
+        """
+        return max(1, _CHUNK_SAMPLES // (self._nfft * n_channels))
+
+
+    def _pad_frames(self, channels, f0, f1):
+        """
+        Returns (buf, buf_start), the zero padded channels (shape n_channels,
+        n_samples) covering frames [f0, f1), buf starts at padded index
+        buf_start.
+
+        Padded index j is signal index j - nfft // 2.  Like the original
+        per-frame slicing, the last sample of the signal is never used.
+        """
+
+        n_channels, N = channels.shape
+        h_frame = self._nfft // 2
+
+        p0 = f0 * self._step
+        p1 = (f1 - 1) * self._step + self._nfft
+
+        buf = np.zeros((n_channels, p1 - p0), np.result_type(channels.dtype, np.float32))
+
+        i0 = max(p0 - h_frame, 0)
+        i1 = min(p1 - h_frame, N - 1)
+
+        if i1 > i0:
+            buf[:, i0 + h_frame - p0 : i1 + h_frame - p0] = channels[:, i0 : i1]
+
+        return buf, p0
+
+
+    def _rfft_frames(self, buf, offset, n_frames):
+        """
+        Windows and transforms n_frames frames along the last axis of buf, the
+        first frame starts at buf[..., offset], without copying the
+        overlapping frames.  Leading axes (channels) are transformed in the
+        same batched call.
+        """
+
+        buf = buf[..., offset : offset + (n_frames - 1) * self._step + self._nfft]
+
+        if self._sdft is not None:
+            return self._sdft(buf, n_frames)
+
+        stride = buf.strides[-1]
+
+        frames = as_strided(
+            buf,
+            shape = buf.shape[:-1] + (n_frames, self._nfft),
+            strides = buf.strides[:-1] + (self._step * stride, stride),
+            writeable = False,
+        )
+
+        windowed = self._scratch(frames.shape, self._real_dtype)
+
+        np.multiply(frames, self._window, out = windowed)
+
+        if self._zoom is not None:
+            return self._zoom(windowed)
+
+        X = self._fft.rfft(windowed, axis = -1)
+
+        if self._bins is not None:
+            X = X[..., self._bins]
+
+        return X
+
+
+    def _reduce(self, X, out):
+        """
+        Writes the complex frames X into out according to the output mode,
+        real valued modes are computed in place in out without temporaries,
+        except for the chunk of bins projected by a filterbank.
+        """
+
+        if self._output == 'complex':
+            out[...] = X
+            return
+
+        # with a filterbank the bins are reduced in a chunk sized temporary
+        # and projected into out
+
+        mag = out
+
+        if self._filterbank is not None:
+            mag = np.empty(X.shape, self._real_dtype)
+
+        np.abs(X, out = mag)
+
+        if self._output in ['power', 'db']:
+            np.square(mag, out = mag)
+
+        if self._filterbank is not None:
+            self._filterbank.project(mag, out = out)
+
+        if self._output == 'db':
+            np.maximum(out, _DB_FLOOR_POWER, out = out)
+            np.log10(out, out = out)
+            out *= 10.0
+
+        elif self._output == 'compressed':
+            np.power(out, self._output_exponent, out = out)
+
+
+    def _scratch(self, shape, dtype):
+        """
+        Returns a reusable buffer of the given shape and dtype, one per thread
+        so a shared instance can be called from several threads.
+        """
+
+        buf = getattr(self._local, 'buf', None)
+
+        size = int(np.prod(shape))
+
+        if buf is None or buf.dtype != dtype or buf.size < size:
+            buf = np.empty(size, dtype)
+            self._local.buf = buf
+
+        return buf[:size].reshape(shape)
+
+
+# number of samples worth of frames to transform per batched fft call
+
+_CHUNK_SAMPLES = 2 ** 20
+
+
+class StreamingStft(Stft):
+    """
+    Online stft that accepts pushed blocks of any length.
+
+    Each push() returns every frame completed by the new samples.  A frame is
+    completed once a sample after its last sample has arrived, since the last
+    sample of a signal is never used by Stft.__call__().  Between calls only
+    the samples of the next incomplete frame are kept, that is the nfft - step
+    overlap plus any samples received since the last completed frame.
+
+    After the last block, flush() returns the frames that overlap the end of
+    the signal and resets the state for a new signal.  The concatenation of
+    all returned frames is identical to calling Stft on the concatenation of
+    all blocks.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        keyword arguments: same as Stft.
+        """
+
+        Stft.__init__(self, **kwargs)
+
+        self.reset()
+
+
+    def reset(self):
+        """
+        Discards all buffered samples, the next push() starts a new signal.
+        """
+
+        # buf holds the zero padded signal, channels first, starting at padded
+        # index buf_start, padded index j is signal index j - nfft // 2.  It is
+        # created by the first push() once the number of channels is known.
+
+        self._buf = None
+        self._buf_start = 0
+        self._n_received = 0
+        self._i_frame = 0
+
+        self._decimator = None
+
+        if self._decimate > 1:
+            self._decimator = decimate.Decimator(self._decimate, dtype = self._real_dtype)
+
+
+    def push(self, block):
+        """
+        Appends block to the signal, block is 1D or 2D with shape (n_samples,
+        n_channels) like the Stft signal.
+
+        returns dict: stft_spec, stft_freq_axis, stft_time_axis, with the
+        frames completed by block, possibly none.
+        """
+
+        block = np.asarray(block)
+
+        assert block.ndim in [1, 2], "block must be 1D or 2D"
+
+        if self._decimator is not None:
+            block = self._decimator.push(block.T).T
+
+        return self._push(block)
+
+
+    def _push(self, block):
+        """
+        Appends a block at the frame rate, see push().
+        """
+
+        nfft = self._nfft
+        step = self._step
+        h_frame = nfft // 2
+
+        if self._buf is None:
+            self._buf = np.zeros(block.shape[1:] + (h_frame,), np.float32)
+
+        assert self._buf.shape[:-1] == block.shape[1:], "number of channels changed"
+
+        if len(block) > 0:
+            self._buf = np.concatenate([self._buf, block.T], axis = -1)
+            self._n_received += len(block)
+
+        # number of frames that end before the last sample received
+
+        n_complete = (self._n_received - h_frame - 1) // step + 1
+
+        n_complete = min(n_complete, _n_frames(self._n_received, nfft, step))
+
+        n_complete = max(n_complete - self._i_frame, 0)
+
+        out = self._transform_padded(self._buf, self._buf_start, self._i_frame, n_complete)
+
+        self._i_frame += n_complete
+
+        # drop samples that no remaining frame needs
+
+        drop = min(self._i_frame * step - self._buf_start, self._buf.shape[-1])
+
+        self._buf = self._buf[..., drop:]
+        self._buf_start += drop
+
+        return out
+
+
+    def flush(self):
+        """
+        Ends the signal.
+
+        returns dict: stft_spec, stft_freq_axis, stft_time_axis, with the
+        remaining frames that overlap the end of the signal.
+        """
+
+        head = None
+
+        if self._decimator is not None:
+            head = self._push(self._decimator.flush().T)
+
+        n_total = 0
+
+        if self._n_received > 0:
+            n_total = _n_frames(self._n_received, self._nfft, self._step)
+
+        n_left = max(n_total - self._i_frame, 0)
+
+        buf = self._buf
+        buf_start = self._buf_start
+
+        if buf is None:
+            buf = np.zeros(0, np.float32)
+
+        # zero the last sample and pad with zeros past the end
+
+        end = (n_total - 1) * self._step + self._nfft - buf_start
+
+        n = buf.shape[-1]
+
+        tail = np.zeros(buf.shape[:-1] + (max(end, n),), buf.dtype)
+
+        if n > 0:
+            tail[..., : n - 1] = buf[..., :-1]
+
+        out = self._transform_padded(tail, buf_start, self._i_frame, n_left)
+
+        self.reset()
+
+        if head is not None:
+            out.update(
+                stft_spec = np.concatenate([head['stft_spec'], out['stft_spec']], axis = -2),
+                stft_time_axis = np.concatenate([head['stft_time_axis'], out['stft_time_axis']]),
+            )
+
+        return out
+
+
+class Istft(Stft):
+    """
+    Inverse short time Fourier transform.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Resynthesizes a signal from Stft output by weighted overlap-add.
+
+        keyword arguments: same as the Stft that computed the spectrum.
+        """
+
+        Stft.__init__(self, **kwargs)
+
+        assert self._decimate == 1, "Istft does not support decimate"
+
+        # synthesis window, the same as the analysis window
+
+        self._window_sq = self._window.astype(np.float64) ** 2
+
+
+    def __call__(self, **kwargs):
+        """
+        inputs: stft_spec, sample_rate, n_samples (optional)
+        outputs: istft_signal
+
+        Each frame is inverse transformed and multiplied by the window again,
+        the frames are then overlap-added and divided by the overlap-added
+        squared window.  Samples where the squared window sum is tiny, i.e.
+        not covered by any frame, are set to zero.
+
+        The last sample of the signal is never used by Stft.__call__(), so it
+        is always resynthesized as zero.
+        """
+
+        spec = kwargs['stft_spec']
+        sample_rate = kwargs['sample_rate']
+        n_samples = kwargs.get('n_samples', None)
+
+        assert int(self._sample_rate) == int(sample_rate), "sample_rate != %d" % self._sample_rate
+        assert spec.ndim == 2, "stft_spec must be 2D"
+        assert np.iscomplexobj(spec), "stft_spec must be complex, use output = 'complex'"
+        assert spec.shape[1] == len(self._freq_axis), "stft_spec has the wrong number of bins"
+
+        n_time = len(spec)
+        h_frame = self._nfft // 2
+
+        if n_samples is None:
+            n_samples = max(n_time * self._step - h_frame, 0)
+
+        # overlap-add into padded coordinates, padded index j is signal index
+        # j - h_frame
+
+        size = max((n_time - 1) * self._step + self._nfft, n_samples + h_frame, 0)
+
+        num = np.zeros(size, np.float64)
+        den = np.zeros(size, np.float64)
+
+        self._overlap_add(spec, 0, num, den, 0)
+
+        signal = _normalize(num, den, self._real_dtype)[h_frame : h_frame + n_samples]
+
+        kwargs.update(dict(istft_signal = signal))
+        kwargs.update(self._fft_info('istft'))
+
+        return kwargs
+
+
+    def _overlap_add(self, spec, i_frame, num, den, buf_start):
+        """
+        Adds the windowed inverse transform of each frame of spec, the first
+        being frame index i_frame, into num and the squared window into den.
+        num and den start at padded index buf_start.
+        """
+
+        nfft = self._nfft
+        step = self._step
+
+        chunk = self._chunk_frames()
+
+        for f0 in range(0, len(spec), chunk):
+
+            f1 = min(f0 + chunk, len(spec))
+
+            frames = self._fft.irfft(spec[f0 : f1], n = nfft, axis = 1)
+
+            frames = frames * self._window
+
+            # scatter-add all frames of the chunk at once
+
+            offset = (i_frame + f0) * step - buf_start
+
+            starts = offset + np.arange(f1 - f0) * step
+
+            idx = (starts[:, None] + np.arange(nfft)[None, :]).ravel()
+
+            p0 = offset
+            p1 = starts[-1] + nfft
+
+            num[p0 : p1] += np.bincount(idx - p0, frames.ravel(), p1 - p0)
+
+            den[p0 : p1] += np.bincount(
+                idx - p0,
+                np.broadcast_to(self._window_sq, frames.shape).ravel(),
+                p1 - p0,
+            )
+
+
+class StreamingIstft(Istft):
+    """
+    Online inverse stft that accepts pushed blocks of frames.
+
+    Each push() returns the signal samples that no later frame can overlap,
+    flush() returns the rest and resets the state for a new signal.  Only
+    nfft samples of overlap-add state are kept between calls.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        keyword arguments: same as Stft.
+        """
+
+        Istft.__init__(self, **kwargs)
+
+        self.reset()
+
+
+    def reset(self):
+        """
+        Discards all state, the next push() starts a new signal.
+        """
+
+        # num & den start at padded index buf_start
+
+        self._num = np.zeros(self._nfft, np.float64)
+        self._den = np.zeros(self._nfft, np.float64)
+        self._buf_start = 0
+        self._i_frame = 0
+
+
+    def push(self, spec):
+        """
+        Appends the frames in spec (shape n_frames, n_freq).
+
+        returns 1D array of completed signal samples, possibly empty.
+        """
+
+        assert spec.ndim == 2, "spec must be 2D"
+        assert np.iscomplexobj(spec), "spec must be complex, use output = 'complex'"
+        assert spec.shape[1] == len(self._freq_axis), "spec has the wrong number of bins"
+
+        n_frames = len(spec)
+
+        if n_frames == 0:
+            return np.zeros(0, self._real_dtype)
+
+        # grow the state to hold the new frames
+
+        end = (self._i_frame + n_frames - 1) * self._step + self._nfft - self._buf_start
+
+        if end > len(self._num):
+            self._num = np.hstack([self._num, np.zeros(end - len(self._num))])
+            self._den = np.hstack([self._den, np.zeros(end - len(self._den))])
+
+        self._overlap_add(spec, self._i_frame, self._num, self._den, self._buf_start)
+
+        self._i_frame += n_frames
+
+        # samples before the start of the next frame are final
+
+        done = self._i_frame * self._step - self._buf_start
+
+        done = min(done, len(self._num))
+
+        return self._pop(done)
+
+
+    def flush(self):
+        """
+        Ends the signal.
+
+        returns 1D array with the remaining samples up to the end of the last
+        frame, which may extend past the end of the original signal.
+        """
+
+        done = max((self._i_frame - 1) * self._step + self._nfft - self._buf_start, 0)
+
+        out = self._pop(min(done, len(self._num)))
+
+        self.reset()
+
+        return out
+
+
+    def _pop(self, n):
+        """
+        Removes the first n padded samples from the state and returns the ones
+        that are inside the signal.
+        """
+
+        h_frame = self._nfft // 2
+
+        out = _normalize(self._num[:n], self._den[:n], self._real_dtype)
+
+        # skip the left padding
+
+        skip = max(h_frame - self._buf_start, 0)
+
+        out = out[skip:]
+
+        self._num = np.hstack([self._num[n:], np.zeros(n)])
+        self._den = np.hstack([self._den[n:], np.zeros(n)])
+        self._buf_start += n
+
+        return out
+
+
+def _normalize(num, den, dtype):
+    """
+    Divides the overlap-added frames by the overlap-added squared window.
+    """
+
+    out = np.zeros(len(num), dtype)
+
+    if len(num) == 0:
+        return out
+
+    tiny = np.max(den) * 1e-10
+
+    ok = den > tiny
+
+    out[ok] = num[ok] / den[ok]
+
+    return out
+
+
+def _split_range(n, n_parts, min_size):
+    """
+    Splits [0, n) into at most n_parts contiguous (begin, end) ranges of at
+    least min_size items.
+    """
+
+    n_parts = max(1, min(n_parts, n // max(min_size, 1)))
+
+    edges = np.linspace(0, n, n_parts + 1).astype(np.int64)
+
+    return [(int(e0), int(e1)) for e0, e1 in zip(edges[:-1], edges[1:])]
+
+
+def _process_worker(job):
+    """
+    Process pool entry point, computes one frame range from the shared
+    memory signal into the .npy file at out_path.
+    """
+
+    config, in_name, in_shape, in_dtype, out_path, out_shape, f0, f1 = job
+
+    stft_op = get_stft(**config)
+
+    shm_in = shared_memory.SharedMemory(name = in_name)
+
+    try:
+        channels = np.ndarray(in_shape, np.dtype(in_dtype), shm_in.buf)
+
+        spec = np.load(out_path, mmap_mode = 'r+').reshape(out_shape)
+
+        stft_op._transform_range(channels, spec, f0, f1)
+
+        spec.flush()
+
+        # drop the views before closing the shared memory
+
+        del channels
+        del spec
+
+    finally:
+        shm_in.close()
+
+
+OUTPUTS = ['complex', 'magnitude', 'power', 'db', 'compressed']
+
+# power floor for the 'db' output, -200 dB
+
+_DB_FLOOR_POWER = 1e-20
+
+
+# precision name : (real dtype, complex dtype)
+
+PRECISIONS = dict(
+    single = (np.float32, np.complex64),
+    double = (np.float64, np.complex128),
+)
+
+
+#-----------------------------------------------------------------------------
+# memoized setup
+
+
+class _LruCache(object):
+    """
+    A small thread safe least recently used cache.
+    """
+
+    def __init__(self, maxsize):
+        assert maxsize > 0, "maxsize <= 0"
+        self._maxsize = maxsize
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key, factory):
+        """
+        Returns the cached value for key, calling factory() on a miss.
+        """
+
+        with self._lock:
+
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+
+        value = factory()
+
+        with self._lock:
+
+            self._items[key] = value
+            self._items.move_to_end(key)
+
+            while len(self._items) > self._maxsize:
+                self._items.popitem(last = False)
+
+        return value
+
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+    def __len__(self):
+        return len(self._items)
+
+
+_SETUP_CACHE = _LruCache(64)
+
+_STFT_CACHE = _LruCache(32)
+
+
+def get_stft(**kwargs):
+    """
+    Returns a shared Stft for the configuration, keyword arguments override
+    Stft.get_defaults().  Instances are cached by the full configuration, so
+    repeated requests with the same configuration skip the setup.
+    """
+
+    cfg = Stft.get_defaults()
+    cfg.update(kwargs)
+
+    key = _config_key(cfg)
+
+    return _STFT_CACHE.get(key, lambda : Stft(**cfg))
+
+
+def _config_key(cfg):
+
+    # sequences such as sdft_bins are keyed by value
+
+    items = []
+
+    for key, value in sorted(cfg.items()):
+
+        if isinstance(value, (list, np.ndarray)):
+            value = tuple(np.asarray(value).tolist())
+
+        items.append((key, value))
+
+    return tuple(items)
+
+
+def _setup(sr, t_sigma, t_step, f_step, window, kaiser_beta, policy):
+    """
+    Returns (step, nfft, freq_axis, window), the arrays are read only and
+    shared between all callers with the same arguments.
+    """
+
+    key = (sr, t_sigma, t_step, f_step, window, kaiser_beta, policy)
+
+    return _SETUP_CACHE.get(key, lambda : _compute_setup(*key))
+
+
+def _compute_setup(sr, t_sigma, t_step, f_step, window, kaiser_beta, policy):
+
+    step = int(np.round(sr * t_step))
+
+    #-------------------------------------------------------------------------
+    # compute frame size, rounded up to a fast fft size
+
+    size_f_step = int(sr / f_step)
+    size_t_sigma = int(np.round(sr * 6.0 * t_sigma))
+
+    frame_size = FFT_SIZE_POLICIES[policy](min(size_f_step, size_t_sigma))
+    nfft = frame_size
+
+    #-------------------------------------------------------------------------
+    # setup freq axis
+
+    nyquist = sr / 2.0
+
+    freq_axis = np.linspace(0, nyquist, nfft // 2 + 1).astype(np.float32)
+
+    #-------------------------------------------------------------------------
+    # window
+
+    w = make_window(window, nfft, sr, t_sigma, kaiser_beta)
+
+    freq_axis.setflags(write = False)
+    w.setflags(write = False)
+
+    return step, nfft, freq_axis, w
+
+
+def make_window(window, nfft, sr, t_sigma, kaiser_beta = 8.6):
+    """
+    Returns the float32 window of length nfft normalized to sum to 1.
+
+    The cosine windows and the kaiser window are periodic (DFT-even), which is
+    the usual choice for spectral analysis.
+    """
+
+    n = np.arange(nfft)
+
+    if window == 'gaussian':
+
+        t = n / float(sr)
+        mu = np.mean(t)
+
+        w = np.exp(-0.5 * ((t - mu) / t_sigma) ** 2.0)
+
+    elif window == 'rectangular':
+        w = np.ones(nfft)
+
+    elif window in COSINE_WINDOWS:
+
+        w = np.zeros(nfft)
+
+        for k, a in enumerate(COSINE_WINDOWS[window]):
+            w += (-1) ** k * a * np.cos(2.0 * np.pi * k * n / nfft)
+
+    elif window == 'kaiser':
+        w = np.kaiser(nfft + 1, kaiser_beta)[:-1]
+
+    else:
+        raise ValueError('unknown window type "%s"' % window)
+
+    w = w.astype(np.float32)
+    w /= np.sum(w)
+
+    return w
+
+
+# cosine sum windows, w[n] = a0 - a1 cos(2 pi n / N) + a2 cos(4 pi n / N) - ...
+
+COSINE_WINDOWS = dict(
+    hann = [0.5, 0.5],
+    hamming = [0.54, 0.46],
+    blackmanharris = [0.35875, 0.48829, 0.14128, 0.01168],
+)
+
+
+# windows the sliding dft can apply, as cosine sums
+
+SDFT_WINDOWS = dict(COSINE_WINDOWS, rectangular = [1.0])
+
+
+def _n_frames(N, frame_size, step):
+    """
+    Returns the number of frames compute_sample_slices() produces.
+    """
+    h_frame = frame_size // 2
+    return (N + h_frame + step - 1) // step
+
+
+def stream_wav(filename, channel = None, block_size = 65536, **kwargs):
+    """
+    Generator that reads a wavefile block by block and yields stft frames as
+    they are computed, see Stft.stream().
+
+    If channel is None and the file has more than one channel, all channels
+    are transformed and stft_spec has shape (n_channels, n_time, n_freq).
+
+    keyword arguments override Stft.get_defaults(), sample_rate is read from
+    the file.
+    """
+
+    chunks = wavio.read_chunks(filename)
+
+    cfg = Stft.get_defaults()
+    cfg.update(kwargs)
+    cfg['sample_rate'] = chunks['fmt ']['sample_rate']
+
+    n_channels = chunks['fmt ']['channels']
+
+    stft_op = Stft(**cfg)
+
+    if channel is not None:
+
+        assert 0 <= channel < n_channels, "channel out of range"
+
+        blocks = (x[:, channel] for x, sr in wavio.read_blocks(filename, block_size))
+
+    elif n_channels == 1:
+        blocks = (x[:, 0] for x, sr in wavio.read_blocks(filename, block_size))
+
+    else:
+        blocks = (x for x, sr in wavio.read_blocks(filename, block_size))
+
+    for data in stft_op.stream(blocks):
+        yield data
+
+
+def stft_wav(filename, channel = None, block_size = 65536, out_path = None, **kwargs):
+    """
+    Computes the stft of a wavefile without loading the whole file, returns
+    a dict with:
+
+        sample_rate, n_samples, stft_spec, stft_freq_axis, stft_time_axis,
+        stft_fft_backend, stft_fft_dtype
+
+    If out_path is given the frames are written into a memory mapped .npy
+    file as they are computed and stft_spec is the file opened read only, so
+    recordings of any length can be transformed with bounded memory.
+    """
+
+    chunks = wavio.read_chunks(filename)
+
+    fmt = chunks['fmt ']
+
+    n_samples = chunks['data']['size'] // (fmt['channels'] * fmt['bits_per_sample'] // 8)
+
+    specs = []
+    times = []
+    data = None
+
+    spec = None
+    i_time = 0
+
+    for data in stream_wav(filename, channel, block_size, **kwargs):
+
+        if out_path is None:
+            specs.append(data['stft_spec'])
+            times.append(data['stft_time_axis'])
+            continue
+
+        x = data['stft_spec']
+
+        if spec is None:
+
+            cfg = dict(kwargs, sample_rate = fmt['sample_rate'])
+
+            stft_op = get_stft(**cfg)
+
+            n_time = stft_op.n_frames(n_samples)
+
+            spec = np.lib.format.open_memmap(
+                out_path,
+                mode = 'w+',
+                dtype = x.dtype,
+                shape = x.shape[:-2] + (n_time, x.shape[-1]),
+            )
+
+        n = x.shape[-2]
+
+        spec[..., i_time : i_time + n, :] = x
+
+        i_time += n
+
+    if data is None:
+        raise wavio.WavIOError('No samples in data chunk: %s' % filename)
+
+    if out_path is None:
+
+        data.update(
+            stft_spec = np.concatenate(specs, axis = -2),
+            stft_time_axis = np.concatenate(times),
+        )
+
+    else:
+
+        assert i_time == spec.shape[-2], "frame count mismatch"
+
+        spec.flush()
+
+        del spec
+
+        time_axis = np.arange(i_time) * stft_op._step
+
+        time_axis = time_axis.astype(np.float32) / stft_op._frame_rate
+
+        save_axes(out_path, data['stft_freq_axis'], time_axis, fmt['sample_rate'])
+
+        data.update(
+            stft_spec = np.load(out_path, mmap_mode = 'r'),
+            stft_time_axis = time_axis,
+        )
+
+    data.update(
+        sample_rate = fmt['sample_rate'],
+        n_samples = n_samples,
+    )
+
+    return data
+
+
+#-----------------------------------------------------------------------------
+# out of core spectrograms
+
+
+def axes_filename(out_path):
+    """
+    Returns the filename the axes of the spectrogram at out_path are saved to.
+    """
+
+    root, ext = os.path.splitext(out_path)
+
+    if ext != '.npy':
+        root = out_path
+
+    return root + '.axes.npz'
+
+
+def save_axes(out_path, freq_axis, time_axis, sample_rate):
+    """
+    Saves the axes of the spectrogram stored at out_path, see axes_filename().
+    """
+
+    np.savez(
+        axes_filename(out_path),
+        stft_freq_axis = freq_axis,
+        stft_time_axis = time_axis,
+        sample_rate = sample_rate,
+    )
+
+
+def load_spectrogram(out_path, mmap_mode = 'r'):
+    """
+    Opens a spectrogram written with out_path, returns a dict with:
+
+        sample_rate, stft_spec, stft_freq_axis, stft_time_axis
+
+    stft_spec is memory mapped, only the frames that are accessed are read
+    from disk.
+    """
+
+    with np.load(axes_filename(out_path)) as npz:
+
+        out = dict(
+            sample_rate = float(npz['sample_rate']),
+            stft_freq_axis = npz['stft_freq_axis'],
+            stft_time_axis = npz['stft_time_axis'],
+        )
+
+    out['stft_spec'] = np.load(out_path, mmap_mode = mmap_mode)
+
+    return out
+
+
+def round_up2(n):
+    """
+    Rounds up to next power of 2.  Returns n if n is already a power of 2.
+    """
+
+    assert n > 0, "n <= 0"
+
+    return int(2 ** np.ceil(np.log(n) / np.log(2)))
+
+
+def round_up_smooth(n):
+    """
+    Rounds up to the next even 2, 3, 5 smooth number (2**a * 3**b * 5**c with
+    a >= 1).  Returns n if n is already one.
+
+    Frames are split in two halves around their center, so the size is kept
+    even.
+    """
+
+    assert n > 0, "n <= 0"
+
+    best = round_up2(max(n, 2))
+
+    p5 = 1
+
+    while p5 < best:
+
+        p35 = p5
+
+        while p35 < best:
+
+            # smallest 2**a * p35 >= n with a >= 1
+
+            size = 2 * p35
+
+            while size < n:
+                size *= 2
+
+            best = min(best, size)
+
+            p35 *= 3
+
+        p5 *= 5
+
+    return best
+
+
+FFT_SIZE_POLICIES = dict(
+    smooth = round_up_smooth,
+    pow2 = round_up2,
+)
+
+
+def compute_sample_slices(N, frame_size, step):
+    """
+    Computes tart and stop indices and padding.
+
+    Returns a numpy structured array with one record per frame:
+
+        (center, begin, end, pad_left, pad_right),
+
+    records unpack like the tuples previously returned, columns are accessed
+    by field name, i.e. sample_slices['center'].
+    """
+
+    assert N > 0, 'N <= 0'
+    assert frame_size > 0, 'frame_size <= 0'
+    assert step > 0, 'step <= 0'
+
+    #-------------------------------------------------------------------------
+    # compute center indicies for each frame
+
+    h_frame = frame_size // 2
+
+    centers = np.arange(0, N + h_frame, step, dtype = np.int64)
+
+    #-------------------------------------------------------------------------
+    # sample ranges, clipped to the signal with the remainder as padding
+
+    i0 = centers - h_frame
+    i1 = centers + h_frame
+
+    sample_slices = np.zeros(len(centers), SAMPLE_SLICE_DTYPE)
+
+    sample_slices['center'] = centers
+    sample_slices['begin'] = np.maximum(i0, 0)
+    sample_slices['end'] = np.minimum(i1, N - 1)
+    sample_slices['pad_left'] = np.maximum(-i0, 0)
+    sample_slices['pad_right'] = np.maximum(i1 - N + 1, 0)
+
+    return sample_slices
+
+
+SAMPLE_SLICE_DTYPE = np.dtype([
+    ('center', np.int64),
+    ('begin', np.int64),
+    ('end', np.int64),
+    ('pad_left', np.int64),
+    ('pad_right', np.int64),
+])
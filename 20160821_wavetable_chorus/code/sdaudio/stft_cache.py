@@ -0,0 +1,413 @@
+"""
+On-disk stft result cache
+
+Spectrograms are stored as memory mapped .npy files keyed by a sha1 of the
+input (the wavefile's content, or a signal's samples) plus the full Stft
+configuration, so re-running a script with only plot or render settings
+changed reuses the spectrum without computing an fft.  The settings that
+only schedule the work, see SCHEDULING_KEYS, are not part of the key.
+
+Each entry is three files in the cache directory:
+
+    <key>.npy : stft_spec, written in place by Stft with out_path
+    <key>.axes.npz : the time and frequency axes, see stft.save_axes()
+    <key>.json : the remaining scalar results
+
+The .json is written last, an entry without one is incomplete and ignored.
+Entries are evicted least recently used first once the directory holds more
+than max_bytes.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import os.path
+import threading
+
+import numpy as np
+
+
+from sdaudio import assert_py3
+from sdaudio import stft
+from sdaudio import wavio
+
+
+VERSION = 1
+
+DEFAULT_MAX_BYTES = 2 ** 32
+
+# Stft settings that don't change the result, not part of the key
+
+SCHEDULING_KEYS = ['n_workers', 'executor', 'fft_workers']
+
+
+def default_directory():
+    """
+    Returns $SDAUDIO_STFT_CACHE, or ~/.cache/sdaudio/stft if it is not set.
+    """
+
+    path = os.environ.get('SDAUDIO_STFT_CACHE')
+
+    if path:
+        return path
+
+    return os.path.join(os.path.expanduser('~'), '.cache', 'sdaudio', 'stft')
+
+
+class StftCache(object):
+    '''
+    A directory of cached stft results with a total size cap.
+    '''
+
+    def __init__(self, directory = None, max_bytes = DEFAULT_MAX_BYTES):
+
+        if directory is None:
+            directory = default_directory()
+
+        assert max_bytes > 0, "max_bytes <= 0"
+
+        os.makedirs(directory, exist_ok = True)
+
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        # content hashes of files by (path, size, mtime), skips re-reading
+        # unchanged files in the same process
+
+        self._file_hashes = dict()
+
+
+    @property
+    def directory(self):
+        return self._directory
+
+
+    def stft_wav(self, filename, channel = None, block_size = 65536, **kwargs):
+        '''
+        Cached stft.stft_wav(), returns the same dict with stft_spec opened
+        read only from the cache.
+        '''
+
+        chunks = wavio.read_chunks(filename)
+
+        cfg = _full_config(kwargs, chunks['fmt ']['sample_rate'])
+
+        key = self._key(
+            self._file_hash(filename),
+            dict(cfg, channel = channel),
+        )
+
+        data = self._load(key)
+
+        if data is not None:
+            return data
+
+        def compute(out_path):
+            return stft.stft_wav(
+                filename, channel, block_size, out_path = out_path, **kwargs)
+
+        return self._store(key, compute)
+
+
+    def stft(self, signal, sample_rate, **kwargs):
+        '''
+        Cached Stft.__call__() on a signal array, keyed by its samples.
+        '''
+
+        cfg = _full_config(kwargs, sample_rate)
+
+        signal = np.ascontiguousarray(signal)
+
+        h = hashlib.sha1()
+        h.update(str((signal.shape, signal.dtype.str)).encode('utf-8'))
+        h.update(signal.data)
+
+        key = self._key(h.hexdigest(), cfg)
+
+        data = self._load(key)
+
+        if data is not None:
+            return data
+
+        def compute(out_path):
+
+            out = stft.get_stft(**cfg)(
+                signal = signal, sample_rate = sample_rate, out_path = out_path)
+
+            # the inputs are not part of the result
+
+            del out['signal']
+            del out['out_path']
+
+            return out
+
+        return self._store(key, compute)
+
+
+    def clear(self):
+        '''
+        Removes every entry.
+        '''
+
+        with self._lock:
+
+            for key in self._entries():
+                self._remove(key)
+
+
+    def size(self):
+        '''
+        Returns the total bytes of all entries.
+        '''
+        return sum(nbytes for key, nbytes, atime in self._entry_stats())
+
+
+    #-------------------------------------------------------------------------
+    # internals
+
+    def _key(self, content_hash, cfg):
+
+        cfg = dict((k, v) for k, v in cfg.items() if k not in SCHEDULING_KEYS)
+
+        h = hashlib.sha1()
+
+        h.update(content_hash.encode('utf-8'))
+        h.update(_canonical(dict(cfg, cache_version = VERSION)).encode('utf-8'))
+
+        return h.hexdigest()
+
+
+    def _file_hash(self, filename):
+
+        st = os.stat(filename)
+
+        stat_key = (os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+
+        content_hash = self._file_hashes.get(stat_key)
+
+        if content_hash is None:
+
+            content_hash = file_hash(filename)
+
+            self._file_hashes[stat_key] = content_hash
+
+        return content_hash
+
+
+    def _path(self, key, ext):
+        return os.path.join(self._directory, key + ext)
+
+
+    def _load(self, key):
+        '''
+        Returns the cached result for key or None, marks it recently used.
+        '''
+
+        meta_path = self._path(key, '.json')
+
+        try:
+            with open(meta_path, 'r') as fd:
+                meta = json.load(fd)
+
+            data = stft.load_spectrogram(self._path(key, '.npy'))
+
+        except (IOError, OSError, ValueError):
+            return None
+
+        # the access time is tracked with the .json modification time, which
+        # works on file systems mounted with noatime
+
+        os.utime(meta_path)
+
+        data.update(meta)
+
+        return data
+
+
+    def _store(self, key, compute):
+        '''
+        Computes a result with compute(out_path) into the cache and returns
+        it opened from the cache.
+        '''
+
+        tmp = self._path(key, '.%d.tmp.npy' % os.getpid())
+
+        try:
+            data = compute(tmp)
+
+            meta = dict()
+
+            for k, v in data.items():
+
+                if isinstance(v, (np.ndarray, np.generic)) and v.ndim == 0:
+                    v = v.item()
+
+                if isinstance(v, (str, int, float, bool)):
+                    meta[k] = v
+
+            # drop the memory map before renaming the file
+
+            del data
+
+            os.replace(stft.axes_filename(tmp), self._path(key, '.axes.npz'))
+            os.replace(tmp, self._path(key, '.npy'))
+
+            meta_tmp = self._path(key, '.%d.json.tmp' % os.getpid())
+
+            with open(meta_tmp, 'w') as fd:
+                json.dump(meta, fd)
+
+            os.replace(meta_tmp, self._path(key, '.json'))
+
+        finally:
+
+            for path in [tmp, stft.axes_filename(tmp)]:
+                if os.path.isfile(path):
+                    os.remove(path)
+
+        self._evict(keep = key)
+
+        return self._load(key)
+
+
+    def _entries(self):
+
+        pattern = os.path.join(self._directory, '*.json')
+
+        return [os.path.basename(p)[: -len('.json')] for p in glob.glob(pattern)]
+
+
+    def _entry_stats(self):
+        '''
+        Yields (key, nbytes, last use) for every complete entry.
+        '''
+
+        for key in self._entries():
+
+            try:
+                atime = os.path.getmtime(self._path(key, '.json'))
+
+                nbytes = sum(
+                    os.path.getsize(self._path(key, ext))
+                    for ext in ['.npy', '.axes.npz', '.json']
+                )
+
+            except OSError:
+                continue
+
+            yield key, nbytes, atime
+
+
+    def _evict(self, keep = None):
+        '''
+        Removes the least recently used entries until the total size is at
+        most max_bytes, never removes keep.
+        '''
+
+        with self._lock:
+
+            stats = sorted(self._entry_stats(), key = lambda s : s[2])
+
+            total = sum(s[1] for s in stats)
+
+            for key, nbytes, atime in stats:
+
+                if total <= self._max_bytes:
+                    break
+
+                if key == keep:
+                    continue
+
+                self._remove(key)
+
+                total -= nbytes
+
+
+    def _remove(self, key):
+
+        # the .json first, so a partially removed entry is never loaded
+
+        for ext in ['.json', '.npy', '.axes.npz']:
+
+            try:
+                os.remove(self._path(key, ext))
+
+            except OSError:
+                pass
+
+
+def file_hash(filename):
+    """
+    Returns the sha1 hex digest of a file's content.
+    """
+
+    h = hashlib.sha1()
+
+    with open(filename, 'rb') as fd:
+
+        for block in iter(lambda : fd.read(2 ** 20), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def _full_config(kwargs, sample_rate):
+    """
+    Returns the full Stft configuration for kwargs, with the 'auto' fft
+    backend resolved since the backends differ in rounding.
+    """
+
+    cfg = stft.Stft.get_defaults()
+    cfg.update(kwargs)
+    cfg['sample_rate'] = sample_rate
+
+    if cfg['fft_backend'] == 'auto':
+        cfg['fft_backend'] = stft.get_stft(**cfg)._fft.name
+
+    return cfg
+
+
+def _canonical(cfg):
+    """
+    A stable string for a configuration dict, sequences as lists.
+    """
+
+    def convert(v):
+
+        if isinstance(v, (np.ndarray, tuple)):
+            return np.asarray(v).tolist()
+
+        if isinstance(v, np.generic):
+            return v.item()
+
+        return v
+
+    return json.dumps(
+        {k : convert(v) for k, v in cfg.items()},
+        sort_keys = True,
+    )
+
+
+_DEFAULT_CACHE = None
+
+
+def get_cache():
+    """
+    Returns the shared StftCache in default_directory().
+    """
+
+    global _DEFAULT_CACHE
+
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = StftCache()
+
+    return _DEFAULT_CACHE
+
+
+def stft_wav(filename, channel = None, block_size = 65536, **kwargs):
+    """
+    stft.stft_wav() through the shared cache, see get_cache().
+    """
+    return get_cache().stft_wav(filename, channel, block_size, **kwargs)
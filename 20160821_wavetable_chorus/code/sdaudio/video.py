@@ -0,0 +1,445 @@
+"""
+Video encoding through an ffmpeg pipe
+
+Streams raw RGB frames into an ffmpeg process on its stdin, so no image
+files are written.  Frames are handed to a writer thread through a bounded
+queue: rendering the next frame overlaps with ffmpeg reading the last one,
+and write() blocks once `queue_size` frames are waiting, so a slow encoder
+holds the renderer back instead of frames piling up in memory.
+
+SegmentedEncoder encodes a long movie as a series of short segments in a
+work directory and joins them at the end, so an interrupted encode resumes
+at the first missing segment.
+
+Assumes ffmpeg is installed and on the PATH.
+"""
+
+import glob
+import os
+import os.path
+import queue
+import subprocess
+import threading
+
+import numpy as np
+
+
+from sdaudio import assert_py3
+
+
+class VideoError(Exception):
+    pass
+
+
+def ffmpeg_command(
+    filename,
+    size,
+    fps,
+    audio_filename = None,
+    ffmpeg = 'ffmpeg',
+    codec = 'libx264',
+    bitrate = '4M'):
+    """
+    Returns the ffmpeg argument list that encodes rgb24 frames of size
+    (width, height) from stdin into filename, muxed with audio_filename if
+    given.
+    """
+
+    W, H = size
+
+    cmd = [
+        ffmpeg,
+        '-y',
+        '-loglevel', 'error',
+        '-f', 'rawvideo',
+        '-pix_fmt', 'rgb24',
+        '-s', '%dx%d' % (W, H),
+        '-r', '%r' % float(fps),
+        '-i', '-',
+    ]
+
+    if audio_filename is not None:
+        cmd += ['-i', audio_filename]
+
+    cmd += [
+        '-vcodec', codec,
+        '-pix_fmt', 'yuv420p',
+        '-b:v', bitrate,
+        '-strict', '-2',
+    ]
+
+    if audio_filename is not None:
+        cmd += ['-shortest']
+
+    cmd += [filename]
+
+    return cmd
+
+
+class VideoWriter(object):
+    '''
+    Encodes RGB frames (H, W, 3) uint8 into a video file with ffmpeg.
+
+    Call write() for every frame, then close(), which waits for ffmpeg and
+    raises VideoError if it failed.  abort() stops ffmpeg without waiting.
+    '''
+
+    def __init__(
+        self,
+        filename,
+        size,
+        fps,
+        audio_filename = None,
+        queue_size = 8,
+        **kwargs):
+
+        assert fps > 0, "fps <= 0"
+        assert queue_size > 0, "queue_size <= 0"
+
+        self._size = (int(size[0]), int(size[1]))
+
+        self._cmd = ffmpeg_command(filename, self._size, fps, audio_filename, **kwargs)
+
+        try:
+            self._proc = subprocess.Popen(self._cmd, stdin = subprocess.PIPE)
+
+        except OSError as e:
+            raise VideoError('could not start %s: %s' % (self._cmd[0], e))
+
+        self._queue = queue.Queue(maxsize = queue_size)
+        self._error = None
+        self._n_frames = 0
+
+        self._thread = threading.Thread(target = self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    @property
+    def command(self):
+        return list(self._cmd)
+
+
+    @property
+    def n_frames(self):
+        return self._n_frames
+
+
+    def write(self, frame):
+        '''
+        Queues one frame, blocks while the queue is full.  The frame is
+        copied, the caller may reuse its buffer.
+        '''
+
+        W, H = self._size
+
+        assert frame.shape == (H, W, 3), "frame is not %dx%d RGB" % (W, H)
+
+        data = np.ascontiguousarray(frame, np.uint8).tobytes()
+
+        # don't block forever on a queue nobody reads
+
+        while True:
+
+            self._check()
+
+            try:
+                self._queue.put(data, timeout = 0.5)
+                break
+
+            except queue.Full:
+                pass
+
+        self._n_frames += 1
+
+
+    def close(self):
+        '''
+        Waits for the queued frames and for ffmpeg to finish.
+        '''
+
+        if self._proc is None:
+            return
+
+        while self._thread.is_alive():
+
+            try:
+                self._queue.put(None, timeout = 0.5)
+                break
+
+            except queue.Full:
+                pass
+
+        self._thread.join()
+
+        returncode = self._proc.wait()
+
+        self._proc = None
+
+        if self._error is not None:
+            raise VideoError('writing to ffmpeg failed: %s' % self._error)
+
+        if returncode != 0:
+            raise VideoError('ffmpeg exited with status %d' % returncode)
+
+
+    def abort(self):
+        '''
+        Kills ffmpeg and drops the queued frames.
+        '''
+
+        if self._proc is None:
+            return
+
+        self._proc.kill()
+        self._proc.wait()
+
+        # unblock the writer thread
+
+        while self._thread.is_alive():
+
+            try:
+                self._queue.get_nowait()
+
+            except queue.Empty:
+                pass
+
+            try:
+                self._queue.put_nowait(None)
+
+            except queue.Full:
+                pass
+
+            self._thread.join(0.1)
+
+        self._proc = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        if exc_type is None:
+            self.close()
+
+        else:
+            self.abort()
+
+
+    #-------------------------------------------------------------------------
+    # internals
+
+    def _check(self):
+
+        if self._error is None and self._thread.is_alive():
+            return
+
+        # a broken pipe usually means ffmpeg exited, its status says more
+
+        try:
+            returncode = self._proc.wait(timeout = 5.0)
+
+        except subprocess.TimeoutExpired:
+            returncode = None
+
+        self.abort()
+
+        if returncode:
+            raise VideoError('ffmpeg exited with status %d' % returncode)
+
+        raise VideoError('writing to ffmpeg failed: %s' % self._error)
+
+
+    def _run(self):
+        '''
+        The writer thread, copies queued frames to ffmpeg's stdin until the
+        None sentinel.
+        '''
+
+        stdin = self._proc.stdin
+
+        try:
+            while True:
+
+                data = self._queue.get()
+
+                if data is None:
+                    break
+
+                stdin.write(data)
+
+        except (IOError, OSError, ValueError) as e:
+            self._error = e
+
+        finally:
+
+            try:
+                stdin.close()
+
+            except (IOError, OSError):
+                pass
+
+
+def concat_command(list_filename, filename, audio_filename = None, ffmpeg = 'ffmpeg'):
+    """
+    Returns the ffmpeg argument list that joins the videos listed in
+    list_filename (ffmpeg's concat demuxer format) into filename without
+    re-encoding, muxed with audio_filename if given.
+    """
+
+    cmd = [
+        ffmpeg,
+        '-y',
+        '-loglevel', 'error',
+        '-f', 'concat',
+        '-i', list_filename,
+    ]
+
+    if audio_filename is not None:
+        cmd += ['-i', audio_filename, '-map', '0:v', '-map', '1:a']
+
+    cmd += ['-vcodec', 'copy']
+
+    if audio_filename is not None:
+        cmd += ['-strict', '-2', '-shortest']
+
+    cmd += [filename]
+
+    return cmd
+
+
+class SegmentedEncoder(object):
+    '''
+    Encodes a movie of n_frames frames as segments of segment_frames frames
+    in work_dir.
+
+    A segment is encoded under a temporary name and renamed once ffmpeg
+    finished it, so every segment file present is complete.  Encoding again
+    with the same work_dir skips them, see pending().  finish() joins the
+    segments with ffmpeg's concat demuxer and adds the audio.
+
+    kwargs are passed on to ffmpeg_command().
+    '''
+
+    def __init__(
+        self,
+        work_dir,
+        n_frames,
+        size,
+        fps,
+        segment_frames = 600,
+        **kwargs):
+
+        assert n_frames > 0, "n_frames <= 0"
+        assert segment_frames > 0, "segment_frames <= 0"
+
+        os.makedirs(work_dir, exist_ok = True)
+
+        self._work_dir = work_dir
+        self._n_frames = n_frames
+        self._size = size
+        self._fps = fps
+        self._segment_frames = segment_frames
+        self._kwargs = kwargs
+
+        # leftovers of an interrupted segment
+
+        for path in glob.glob(os.path.join(work_dir, '*.tmp.mp4')):
+            os.remove(path)
+
+
+    @property
+    def work_dir(self):
+        return self._work_dir
+
+
+    @property
+    def segments(self):
+        '''
+        The list of (k, i0, i1), segment k holds frames [i0, i1).
+        '''
+
+        n = self._segment_frames
+
+        return [
+            (k, i0, min(i0 + n, self._n_frames))
+            for k, i0 in enumerate(range(0, self._n_frames, n))
+        ]
+
+
+    def segment_filename(self, k):
+        return os.path.join(self._work_dir, 'segment_%06d.mp4' % k)
+
+
+    def is_done(self, k):
+        return os.path.isfile(self.segment_filename(k))
+
+
+    def pending(self):
+        '''
+        The segments still to encode, see segments.
+        '''
+        return [s for s in self.segments if not self.is_done(s[0])]
+
+
+    def encode(self, k, frames):
+        '''
+        Encodes segment k from the frames iterable, which must yield exactly
+        the segment's frames.
+        '''
+
+        k, i0, i1 = self.segments[k]
+
+        filename = self.segment_filename(k)
+
+        tmp = filename[: -len('.mp4')] + '.tmp.mp4'
+
+        with VideoWriter(tmp, self._size, self._fps, **self._kwargs) as writer:
+
+            for frame in frames:
+                writer.write(frame)
+
+        if writer.n_frames != i1 - i0:
+            os.remove(tmp)
+            raise VideoError(
+                'segment %d got %d frames, expected %d' % (k, writer.n_frames, i1 - i0))
+
+        os.replace(tmp, filename)
+
+
+    def finish(self, filename, audio_filename = None):
+        '''
+        Joins all segments into filename, muxed with audio_filename if given.
+        '''
+
+        missing = [k for k, i0, i1 in self.pending()]
+
+        if missing:
+            raise VideoError('%d segments are not encoded yet' % len(missing))
+
+        # the listed names are relative to the list file
+
+        list_filename = os.path.join(self._work_dir, 'segments.txt')
+
+        with open(list_filename, 'w') as fd:
+
+            for k, i0, i1 in self.segments:
+                fd.write("file '%s'\n" % os.path.basename(self.segment_filename(k)))
+
+        cmd = concat_command(
+            list_filename,
+            filename,
+            audio_filename,
+            self._kwargs.get('ffmpeg', 'ffmpeg'),
+        )
+
+        try:
+            returncode = subprocess.call(cmd)
+
+        except OSError as e:
+            raise VideoError('could not start %s: %s' % (cmd[0], e))
+
+        if returncode != 0:
+            raise VideoError('ffmpeg exited with status %d' % returncode)
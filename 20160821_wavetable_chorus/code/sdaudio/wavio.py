@@ -446,16 +446,7 @@ def read(filename, dtype = np.float32):
 
     # interpret the format chunk dtype
 
-    dt = chunks['fmt ']['dtype']
-
-    if   dt == 'uint8':   dt = np.uint8; bps = 1
-    elif dt == 'int16':   dt = np.int16; bps = 2
-    elif dt == 'int32':   dt = np.int32; bps = 4
-    elif dt == 'int64':   dt = np.int64; bps = 8
-    elif dt == 'float32': dt = np.float32; bps = 4
-    elif dt == 'float64': dt = np.float64; bps = 8
-    else:
-        raise RuntimeError("Don't know how to interpret data chunk!")
+    dt = _interpret_dtype(chunks)
 
     #--------------------------------------------------------------------------
     # read the data chunk
@@ -503,6 +494,115 @@ def read(filename, dtype = np.float32):
     if dtype is None:
         return data
 
+    data = _convert_dtype(data, dt, bytes_per_sample, dtype)
+
+    return data, chunks['fmt ']['sample_rate']
+
+
+def read_blocks(filename, block_size = 65536, dtype = np.float32):
+    """
+    Generator that reads a RIFF WAVE file in blocks of at most block_size
+    samples per channel.
+
+    Yields (block, sample_rate) tuples where block is a 2D array of shape
+    (n_samples, n_channels).  Only one block is held in memory at a time, so
+    files of any length can be processed with constant memory.
+
+    defaults to yielding arrays of type np.float32, setting dtype = None will
+    yield the raw type.
+    """
+
+    if dtype is not None:
+        assert dtype in [np.float32, np.float64], 'dtype must be None, np.float32 or np.float64'
+
+    assert block_size > 0, 'block_size <= 0'
+
+    chunks = read_chunks(filename)
+
+    dt = _interpret_dtype(chunks)
+
+    sr = chunks['fmt ']['sample_rate']
+    n_channels = chunks['fmt ']['channels']
+    bytes_per_sample = chunks['fmt ']['bits_per_sample'] // 8  # magic number
+
+    frame_size = int(n_channels * bytes_per_sample)
+
+    pos = chunks['data']['pos']
+    size = chunks['data']['size']
+
+    # ignore any trailing partial frame
+
+    n_samples = size // frame_size
+
+    with open(filename, 'rb') as fd:
+
+        fd.seek(pos)
+
+        n_read = 0
+
+        while n_read < n_samples:
+
+            n = min(block_size, n_samples - n_read)
+
+            raw = fd.read(n * frame_size)
+
+            n = len(raw) // frame_size
+
+            if n == 0:
+                break
+
+            data = _decode_block(raw[: n * frame_size], dt, bytes_per_sample, n_channels)
+
+            n_read += n
+
+            if dtype is not None:
+                data = _convert_dtype(data, dt, bytes_per_sample, dtype)
+                data = data.astype(dtype, copy = False)
+
+            yield data, sr
+
+
+def _interpret_dtype(chunks):
+
+    dt = chunks['fmt ']['dtype']
+
+    if   dt == 'uint8':   return np.uint8
+    elif dt == 'int16':   return np.int16
+    elif dt == 'int32':   return np.int32
+    elif dt == 'int64':   return np.int64
+    elif dt == 'float32': return np.float32
+    elif dt == 'float64': return np.float64
+
+    raise RuntimeError("Don't know how to interpret data chunk!")
+
+
+def _decode_block(raw, dt, bytes_per_sample, n_channels):
+    """
+    Decodes interleaved little endian sample bytes into a 2D array of shape
+    (n_samples, n_channels) without a python loop per sample.
+    """
+
+    if dt == np.int32 and bytes_per_sample == 3:
+
+        # signed 24 bit ints, assemble the 3 bytes and sign extend
+
+        b = np.frombuffer(raw, np.uint8).reshape(-1, 3).astype(np.int32)
+
+        data = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+
+        data[data >= 0x800000] -= 0x1000000
+
+    else:
+        data = np.frombuffer(raw, np.dtype(dt).newbyteorder('<')).astype(dt)
+
+    return data.reshape(-1, n_channels)
+
+
+def _convert_dtype(data, dt, bytes_per_sample, dtype):
+    """
+    Scales raw integer samples into the range [-1, 1] using dtype.
+    """
+
     if dt == np.uint8:
         data = data.astype(dtype)
         data -= 127.0
@@ -531,7 +631,7 @@ def read(filename, dtype = np.float32):
     elif dt in [np.float32, np.float64]:
         pass
 
-    return data, chunks['fmt ']['sample_rate']
+    return data
 
 
 def _bytes_to_dtype(s, dt):